@@ -5,6 +5,7 @@ from datetime import datetime
 from typing import TYPE_CHECKING
 from email.utils import formataddr
 from mail.utils import convert_to_utc
+from mail.utils.compression import load_value
 from mail.api.auth import validate_user, validate_mailbox
 from mail.utils.validation import validate_mailbox_for_incoming
 from frappe.utils import now, cint, get_datetime, convert_utc_to_system_timezone
@@ -153,7 +154,7 @@ def get_raw_incoming_mails(
 	IM = frappe.qb.DocType("Incoming Mail")
 	query = (
 		frappe.qb.from_(IM)
-		.select(IM.processed_at, IM.name.as_("id"), IM.message)
+		.select(IM.processed_at, IM.name.as_("id"), IM.message, IM.message_blob)
 		.where((IM.docstatus == 1) & (IM.receiver == mailbox))
 		.orderby(IM.processed_at)
 		.limit(limit)
@@ -163,7 +164,7 @@ def get_raw_incoming_mails(
 		query = query.where(IM.processed_at > last_synced_at)
 
 	data = query.run(as_dict=True)
-	mails = [d.message for d in data]
+	mails = [load_value(d.message, d.message_blob) for d in data]
 	last_synced_at = data[-1].processed_at if data else now()
 	last_synced_mail = data[-1].id if data else None
 
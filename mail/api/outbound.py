@@ -1,12 +1,31 @@
 import json
 import frappe
 from frappe import _
+from frappe.utils import cint
+from typing import TYPE_CHECKING
 from email.utils import parseaddr
 from mail.utils.user import get_user_mailboxes
 from mail.rabbitmq import rabbitmq_context
-from mail.config.constants import NEWSLETTER_QUEUE
+from mail.config.constants import NEWSLETTER_QUEUE, NEWSLETTER_TEMPLATE_CHUNK_SIZE
 from mail.utils.cache import get_user_default_mailbox
-from mail.mail.doctype.outgoing_mail.outgoing_mail import create_outgoing_mail
+from mail.utils.rate_limiter import retry_after_on_rate_limit
+from mail.utils.idempotency import (
+	IN_PROGRESS,
+	get_idempotency_key,
+	save_idempotency_keys,
+	reserve_idempotency_key,
+	reserve_idempotency_keys,
+	release_idempotency_keys,
+)
+from mail.mail.doctype.outgoing_mail.outgoing_mail import (
+	create_outgoing_mail,
+	compile_newsletter_template,
+	create_outgoing_mails_in_bulk,
+)
+
+if TYPE_CHECKING:
+	from typing import Iterator
+	from werkzeug.wrappers import Response
 
 
 @frappe.whitelist(methods=["POST"])
@@ -22,25 +41,42 @@ def send(
 	in_reply_to_mail_name: str | None = None,
 	custom_headers: dict | None = None,
 	attachments: list[dict] | None = None,
+	is_async: bool = False,
 ) -> str:
 	"""Send Mail."""
 
+	idempotency_key = get_idempotency_key()
+	if idempotency_key and (result := reserve_idempotency_key(idempotency_key)):
+		if result["status_code"] == 202:
+			set_accepted_status_code()
+
+		return result["name"]
+
+	is_async = cint(is_async)
 	display_name, sender = parseaddr(from_)
-	doc = create_outgoing_mail(
-		sender=sender,
-		to=to,
-		display_name=display_name,
-		cc=cc,
-		bcc=bcc,
-		subject=subject,
-		body_html=html,
-		reply_to=reply_to,
-		in_reply_to_mail_type=in_reply_to_mail_type,
-		in_reply_to_mail_name=in_reply_to_mail_name,
-		custom_headers=custom_headers,
-		attachments=attachments,
-		via_api=1,
-	)
+	with retry_after_on_rate_limit():
+		doc = create_outgoing_mail(
+			sender=sender,
+			to=to,
+			display_name=display_name,
+			cc=cc,
+			bcc=bcc,
+			subject=subject,
+			body_html=html,
+			reply_to=reply_to,
+			in_reply_to_mail_type=in_reply_to_mail_type,
+			in_reply_to_mail_name=in_reply_to_mail_name,
+			custom_headers=custom_headers,
+			attachments=attachments,
+			via_api=1,
+			submit_in_background=is_async,
+		)
+
+	if idempotency_key:
+		save_idempotency_keys({idempotency_key: doc.name}, 202 if is_async else 200)
+
+	if is_async:
+		set_accepted_status_code()
 
 	return doc.name
 
@@ -50,51 +86,80 @@ def send_raw(
 	from_: str,
 	to: str | list[str],
 	raw_message: str,
+	is_async: bool = False,
 ) -> str:
 	"""Send Raw Mail."""
 
+	idempotency_key = get_idempotency_key()
+	if idempotency_key and (result := reserve_idempotency_key(idempotency_key)):
+		if result["status_code"] == 202:
+			set_accepted_status_code()
+
+		return result["name"]
+
+	is_async = cint(is_async)
 	display_name, sender = parseaddr(from_)
-	doc = create_outgoing_mail(
-		sender=sender,
-		to=to,
-		display_name=display_name,
-		raw_message=raw_message,
-		via_api=1,
-	)
+	with retry_after_on_rate_limit():
+		doc = create_outgoing_mail(
+			sender=sender,
+			to=to,
+			display_name=display_name,
+			raw_message=raw_message,
+			via_api=1,
+			submit_in_background=is_async,
+		)
+
+	if idempotency_key:
+		save_idempotency_keys({idempotency_key: doc.name}, 202 if is_async else 200)
+
+	if is_async:
+		set_accepted_status_code()
 
 	return doc.name
 
 
 @frappe.whitelist(methods=["POST"])
-def send_batch() -> list[str]:
+def send_batch() -> list[dict]:
 	"""Send Mails in Batch."""
 
 	mails = json.loads(frappe.request.data.decode())
 	validate_batch(mails, mandatory_fields=["from_", "to", "subject"])
 
-	documents = []
-	for mail in mails:
-		mail = get_mail_dict(mail)
-		doc = create_outgoing_mail(**mail)
-		documents.append(doc.name)
-
-	return documents
+	return send_mails_in_bulk(mails)
 
 
 @frappe.whitelist(methods=["POST"])
-def send_raw_batch() -> list[str]:
+def send_raw_batch() -> list[dict]:
 	"""Send Raw Mails in Batch."""
 
 	mails = json.loads(frappe.request.data.decode())
 	validate_batch(mails, mandatory_fields=["from_", "to", "raw_message"])
 
-	documents = []
-	for mail in mails:
-		mail = get_mail_dict(mail)
-		doc = create_outgoing_mail(**mail)
-		documents.append(doc.name)
+	return send_mails_in_bulk(mails)
 
-	return documents
+
+@frappe.whitelist(methods=["POST"])
+def send_stream(chunk_size: int = 100) -> "Response":
+	"""Send Mails from a newline-delimited JSON body, streaming the result of each line."""
+
+	from werkzeug.wrappers import Response
+
+	chunk_size = min(max(int(chunk_size), 1), 100)
+	context = {
+		"site": frappe.local.site,
+		"sites_path": frappe.local.sites_path,
+		"user": frappe.session.user,
+		"request_ip": frappe.local.request_ip,
+	}
+	# Frappe reads the request body into its cache before dispatch (for the form dict), so the stream is
+	# consumed already. The lines are sliced from the cached body, which is not copied as a whole.
+	lines = iter_lines(frappe.request.get_data(cache=True))
+
+	return Response(
+		stream_send_results(lines, chunk_size, context),
+		mimetype="application/x-ndjson",
+		direct_passthrough=True,
+	)
 
 
 @frappe.whitelist(methods=["POST"])
@@ -107,7 +172,19 @@ def send_newsletter() -> None:
 	if isinstance(mails, dict):
 		mails = [mails]
 
+	# Template mode: {"from_", "subject", "html", "attachments", "recipients": [{"to", "variables"}]}
+	templates = [mail for mail in mails if "recipients" in mail]
+	mails = [mail for mail in mails if "recipients" not in mail]
+
 	validate_batch(mails, mandatory_fields=["from_", "to"])
+	validate_batch(templates, mandatory_fields=["from_", "subject", "recipients"])
+
+	for template in templates:
+		validate_batch(template["recipients"], mandatory_fields=["to"], max_size=None)
+		# Invalid templates are rejected here, the newsletter worker would only log them
+		compile_newsletter_template(
+			{"subject": template.get("subject"), "body_html": template.get("html")}
+		)
 
 	try:
 		with rabbitmq_context() as rmq:
@@ -119,6 +196,22 @@ def send_newsletter() -> None:
 					mail["sender"] = get_user_default_mailbox(user)
 
 				rmq.publish(NEWSLETTER_QUEUE, json.dumps(mail))
+
+			for template in templates:
+				recipients = template.pop("recipients")
+				template = get_mail_dict({**template, "to": None})
+				template.pop("to")
+
+				if template["sender"] not in get_user_mailboxes(user, "Outgoing"):
+					template["sender"] = get_user_default_mailbox(user)
+
+				# The template is expanded per recipient by the newsletter worker
+				for i in range(0, len(recipients), NEWSLETTER_TEMPLATE_CHUNK_SIZE):
+					data = {
+						"template": template,
+						"recipients": recipients[i : i + NEWSLETTER_TEMPLATE_CHUNK_SIZE],
+					}
+					rmq.publish(NEWSLETTER_QUEUE, json.dumps(data))
 	except Exception:
 		frappe.log_error(title="Newsletter Publish", message=frappe.get_traceback())
 		frappe.throw(
@@ -126,11 +219,67 @@ def send_newsletter() -> None:
 		)
 
 
-def validate_batch(mails: list[dict], mandatory_fields: list[str]) -> None:
+def send_mails_in_bulk(mails: list[dict]) -> list[dict]:
+	"""Creates the mails in bulk, returning the original result for an already used `idempotency_key`."""
+
+	keys = [mail.get("idempotency_key") for mail in mails]
+	reserved = reserve_idempotency_keys(list(dict.fromkeys(key for key in keys if key)))
+
+	results = [None] * len(mails)
+	mails_to_create, indexes = [], []
+	seen_keys = set()
+
+	for idx, (mail, key) in enumerate(zip(mails, keys)):
+		if key:
+			if key in seen_keys:
+				results[idx] = {"error": _("Duplicate idempotency_key {0} in batch.").format(key)}
+				continue
+
+			seen_keys.add(key)
+
+			if result := reserved.get(key):
+				if result == IN_PROGRESS:
+					results[idx] = {
+						"error": _("A request with the idempotency_key {0} is already in progress.").format(
+							key
+						)
+					}
+				else:
+					results[idx] = {"name": result["name"]}
+				continue
+
+		mails_to_create.append(get_mail_dict(mail))
+		indexes.append(idx)
+
+	saved_keys, failed_keys = {}, []
+	for idx, result in zip(indexes, create_outgoing_mails_in_bulk(mails_to_create)):
+		results[idx] = result
+
+		if key := keys[idx]:
+			if result.get("name"):
+				saved_keys[key] = result["name"]
+			else:
+				failed_keys.append(key)
+
+	save_idempotency_keys(saved_keys)
+	release_idempotency_keys(failed_keys)
+
+	return results
+
+
+def set_accepted_status_code() -> None:
+	"""Sets the HTTP status code of the response to 202 (Accepted)."""
+
+	frappe.local.response["http_status_code"] = 202
+
+
+def validate_batch(
+	mails: list[dict], mandatory_fields: list[str], max_size: int | None = 100
+) -> None:
 	"""Validates the batch data."""
 
-	if len(mails) > 100:
-		raise frappe.ValidationError("Batch size cannot exceed 100.")
+	if max_size and len(mails) > max_size:
+		raise frappe.ValidationError(f"Batch size cannot exceed {max_size}.")
 
 	for mail in mails:
 		for field in mandatory_fields:
@@ -138,6 +287,64 @@ def validate_batch(mails: list[dict], mandatory_fields: list[str]) -> None:
 				raise frappe.ValidationError(f"{field} is mandatory.")
 
 
+def iter_lines(data: bytes) -> "Iterator[bytes]":
+	"""Yields the lines of the data, each one with its line break."""
+
+	start = 0
+	while start < len(data):
+		end = data.find(b"\n", start) + 1 or len(data)
+		yield data[start:end]
+		start = end
+
+
+def stream_send_results(lines: "Iterator[bytes]", chunk_size: int, context: dict):
+	"""Yields the NDJSON result of each line, inserting the mails in chunks of `chunk_size`."""
+
+	def process_chunk(chunk: list[tuple[int, dict]]):
+		"""Inserts the chunk and yields the result of each line."""
+
+		results = send_mails_in_bulk([mail for line, mail in chunk])
+		frappe.db.commit()
+
+		for (line, mail), result in zip(chunk, results):
+			yield json.dumps({"line": line, **result}) + "\n"
+
+	# The request context is destroyed before the response is iterated, so set up a new one
+	frappe.init(site=context["site"], sites_path=context["sites_path"])
+	frappe.connect()
+
+	try:
+		frappe.set_user(context["user"])
+		frappe.local.request_ip = context["request_ip"]
+
+		chunk = []
+		for line, data in enumerate(lines, start=1):
+			if not data.strip():
+				continue
+
+			try:
+				mail = json.loads(data)
+				content_field = "raw_message" if "raw_message" in mail else "subject"
+				validate_batch([mail], mandatory_fields=["from_", "to", content_field])
+			except Exception as e:
+				yield json.dumps({"line": line, "error": str(e)}) + "\n"
+				continue
+
+			chunk.append((line, mail))
+			if len(chunk) >= chunk_size:
+				yield from process_chunk(chunk)
+				chunk = []
+
+		if chunk:
+			yield from process_chunk(chunk)
+	except Exception:
+		frappe.db.rollback()
+		frappe.log_error(title="Send Stream", message=frappe.get_traceback())
+		yield json.dumps({"error": _("An error occurred while processing the stream.")}) + "\n"
+	finally:
+		frappe.destroy()
+
+
 def get_mail_dict(data: dict) -> dict:
 	"""Returns the mail dict."""
 
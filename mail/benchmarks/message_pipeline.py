@@ -0,0 +1,184 @@
+"""Compares the CPU time and peak memory per mail of the message pipelines of Outgoing Mail.
+
+The previous pipeline builds the attachments in memory, serializes the message once to sign it with
+dkimpy and again to store it, then encodes it for the spam scan. The current pipeline serializes the
+message to bytes once, signing the body while it is written and reusing the bytes afterwards. It runs
+once more with an `EncodedPartCache`, whose hits and misses are printed.
+
+Usage: `python -m mail.benchmarks.message_pipeline [--mails 20] [--attachments 2] [--attachment-size 1]`
+"""
+
+import os
+import time
+import argparse
+import tracemalloc
+from email import policy
+from email.utils import formatdate, make_msgid
+from email.mime.base import MIMEBase
+from email.mime.text import MIMEText
+from email.encoders import encode_base64
+from email.mime.multipart import MIMEMultipart
+from typing import Callable, TYPE_CHECKING
+
+if TYPE_CHECKING:
+	from mail.utils.part_cache import EncodedPartCache
+
+INCLUDE_HEADERS = ["To", "Cc", "From", "Date", "Subject", "Reply-To", "Message-ID", "In-Reply-To"]
+
+
+def get_private_key() -> str:
+	"""Returns a new RSA private key in PEM format."""
+
+	from cryptography.hazmat.primitives import serialization
+	from cryptography.hazmat.primitives.asymmetric import rsa
+
+	private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+	return private_key.private_bytes(
+		encoding=serialization.Encoding.PEM,
+		format=serialization.PrivateFormat.PKCS8,
+		encryption_algorithm=serialization.NoEncryption(),
+	).decode()
+
+
+def get_message() -> MIMEMultipart:
+	"""Returns a message with a plain and an HTML body."""
+
+	message = MIMEMultipart("alternative", policy=policy.SMTP)
+	message["From"] = "Sender <sender@example.com>"
+	message["To"] = "recipient@example.org"
+	message["Subject"] = "Message pipeline benchmark"
+	message["Date"] = formatdate(localtime=True)
+	message["Message-ID"] = make_msgid(domain="example.com")
+
+	body = "The quick brown fox jumps over the lazy dog. " * 200
+	message.attach(MIMEText(body, "plain", "utf-8", policy=policy.SMTP))
+	message.attach(MIMEText(f"<p>{body}</p>", "html", "utf-8", policy=policy.SMTP))
+
+	return message
+
+
+def previous_pipeline(attachments: list[str], private_key: str) -> None:
+	"""Builds, signs, stores and scans the message the way Outgoing Mail did before."""
+
+	from dkim import sign as dkim_sign
+
+	message = get_message()
+	for path in attachments:
+		with open(path, "rb") as file:
+			part = MIMEBase("application", "octet-stream", policy=policy.SMTP)
+			part.set_payload(file.read())
+			encode_base64(part)
+
+		part.add_header("Content-Disposition", f'attachment; filename="{os.path.basename(path)}"')
+		message.attach(part)
+
+	dkim_signature = dkim_sign(
+		message=message.as_string().split("\n", 1)[-1].encode("utf-8"),
+		domain=b"example.com",
+		selector=b"benchmark",
+		privkey=private_key.encode(),
+		include_headers=[header.encode() for header in INCLUDE_HEADERS],
+	)
+	dkim_header = dkim_signature.decode().replace("\n", "").replace("\r", "")
+	message["DKIM-Signature"] = dkim_header[len("DKIM-Signature: ") :]
+
+	# Stored as a string, its length taken as the size and encoded again for the spam scan
+	stored_message = message.as_string()
+	__ = len(stored_message)
+	__ = stored_message.encode("utf-8")
+
+
+def current_pipeline(
+	attachments: list[str], private_key: str, cache: "EncodedPartCache | None" = None
+) -> None:
+	"""Builds, signs, stores and scans the message the way Outgoing Mail does now.
+
+	With a `cache`, the encoded attachments are reused from it, keyed by their file name.
+	"""
+
+	from mail.utils.mime import MIMEWriter
+	from mail.utils.dkim_signer import get_dkim_signer
+	from mail.utils.message_builder import build_message
+
+	writer = MIMEWriter(get_message())
+	for path in attachments:
+		filename = os.path.basename(path)
+		writer.attach(
+			path, "application/octet-stream", filename, content_hash=filename if cache else None
+		)
+
+	signers = [get_dkim_signer("example.com", "benchmark", private_key)]
+	data = build_message(writer.flatten(), signers, INCLUDE_HEADERS, cache)
+
+	# Stored as a string, the same bytes give the size and are sent for the spam scan
+	__ = data.decode("utf-8")
+	__ = len(data)
+
+
+def measure(pipeline: Callable, mails: int, *args) -> tuple[float, float]:
+	"""Returns the CPU time in milliseconds and the peak memory in MB per mail of the pipeline."""
+
+	# Warm up the imports and the parsed DKIM key
+	pipeline(*args)
+
+	cpu_time = time.process_time()
+	for __ in range(mails):
+		pipeline(*args)
+	cpu_time = (time.process_time() - cpu_time) / mails * 1000
+
+	tracemalloc.start()
+	pipeline(*args)
+	__, peak_memory = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+
+	return cpu_time, peak_memory / 1024 / 1024
+
+
+def run(mails: int = 20, attachments: int = 2, attachment_size: float = 1) -> None:
+	"""Runs the pipelines and prints the CPU time and peak memory saved per mail and the part cache stats."""
+
+	from tempfile import TemporaryDirectory
+	from mail.utils.part_cache import EncodedPartCache
+
+	private_key = get_private_key()
+
+	with TemporaryDirectory() as temp_dir:
+		paths = []
+		for i in range(attachments):
+			path = os.path.join(temp_dir, f"attachment-{i}.bin")
+			with open(path, "wb") as file:
+				file.write(os.urandom(int(attachment_size * 1024 * 1024)))
+			paths.append(path)
+
+		previous_cpu_time, previous_memory = measure(previous_pipeline, mails, paths, private_key)
+		current_cpu_time, current_memory = measure(current_pipeline, mails, paths, private_key)
+
+		# Large enough for the encoded attachments to fit in memory, see `EncodedPartCache.max_part_size`
+		cache = EncodedPartCache(max_size=8 * int(attachments * attachment_size * 1024 * 1024))
+		cached_cpu_time, cached_memory = measure(current_pipeline, mails, paths, private_key, cache)
+
+	print(f"{mails} mails, {attachments} x {attachment_size} MB attachments")
+	print(f"{'':<10}{'CPU (ms/mail)':>16}{'Peak memory (MB/mail)':>24}")
+	print(f"{'Previous':<10}{previous_cpu_time:>16.2f}{previous_memory:>24.2f}")
+	print(f"{'Current':<10}{current_cpu_time:>16.2f}{current_memory:>24.2f}")
+	print(f"{'Cached':<10}{cached_cpu_time:>16.2f}{cached_memory:>24.2f}")
+	print(
+		f"{'Saved':<10}{previous_cpu_time - current_cpu_time:>16.2f}"
+		f"{previous_memory - current_memory:>24.2f}"
+	)
+
+	stats = cache.get_stats()
+	print(
+		f"Part cache: {stats['hits']} hits, {stats['misses']} misses, "
+		f"{stats['parts']} parts, {stats['size'] / 1024 / 1024:.2f} MB"
+	)
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument("--mails", type=int, default=20)
+	parser.add_argument("--attachments", type=int, default=2)
+	parser.add_argument("--attachment-size", type=float, default=1, help="in MB")
+	args = parser.parse_args()
+
+	run(args.mails, args.attachments, args.attachment_size)
@@ -0,0 +1,50 @@
+import click
+from frappe.commands import get_site, pass_context
+
+
+@click.command("mail-transfer")
+@click.option(
+	"--poll-interval",
+	default=5,
+	type=int,
+	help="Seconds to wait for a submitted mail before checking for pending mails anyway.",
+)
+@pass_context
+def mail_transfer(context, poll_interval: int = 5) -> None:
+	"""Run the transfer daemon, which transfers the outgoing mails to RabbitMQ as soon as they are submitted."""
+
+	import frappe
+	from mail.mail.doctype.outgoing_mail.outgoing_mail import run_transfer_daemon
+
+	frappe.init(site=get_site(context))
+	frappe.connect()
+
+	try:
+		run_transfer_daemon(poll_interval)
+	finally:
+		frappe.destroy()
+
+
+@click.command("mail-consumer")
+@click.argument("queue", type=click.Choice(["incoming-mails", "outgoing-mails-status"]))
+@pass_context
+def mail_consumer(context, queue: str) -> None:
+	"""Run a consumer, which processes the messages of the agents as soon as RabbitMQ pushes them."""
+
+	import frappe
+	from mail.mail.doctype.incoming_mail.incoming_mail import run_incoming_mail_consumer
+	from mail.mail.doctype.outgoing_mail.outgoing_mail import run_outgoing_mail_status_consumer
+
+	frappe.init(site=get_site(context))
+	frappe.connect()
+
+	try:
+		if queue == "incoming-mails":
+			run_incoming_mail_consumer()
+		else:
+			run_outgoing_mail_status_consumer()
+	finally:
+		frappe.destroy()
+
+
+commands = [mail_transfer, mail_consumer]
@@ -6,6 +6,19 @@ NAMESERVERS: list = [
 ]
 
 NEWSLETTER_QUEUE: str = "mail::newsletters"
+NEWSLETTER_TEMPLATE_CHUNK_SIZE: int = 1000
 OUTGOING_MAIL_QUEUE: str = "mail::outgoing_mails"
 INCOMING_MAIL_QUEUE: str = "mail_agent::incoming_mails"
 OUTGOING_MAIL_STATUS_QUEUE: str = "mail_agent::outgoing_mails_status"
+TRANSFER_NOTIFICATION_KEY: str = "mail::transfer_notification"
+TRANSFER_DEFICITS_KEY: str = "mail::transfer_deficits"
+TRANSFER_OFFSET_KEY: str = "mail::transfer_offset"
+TRANSFER_MAX_ROUNDS: int = 4
+# Blobs put within the period are never deleted, a transaction may reference them but not be committed yet
+BLOB_GRACE_PERIOD: int = 24 * 60 * 60
+QUEUE_ID_KEY_PREFIX: str = "mail::queue_id::"
+QUEUE_ID_KEY_EXPIRY: int = 7 * 24 * 60 * 60
+NOTIFICATION_WINDOW: int = 1
+NOTIFICATION_USERS_KEY: str = "mail::notification_users"
+NOTIFICATION_FLUSH_KEY: str = "mail::notification_flush"
+NOTIFICATION_QUEUE_KEY_PREFIX: str = "mail::notifications::"
@@ -33,6 +33,11 @@ website_redirects = [
 		"target": "/api/method/mail.api.outbound.send_raw_batch",
 		"redirect_http_status": 307,
 	},
+	{
+		"source": "/outbound/send-stream",
+		"target": "/api/method/mail.api.outbound.send_stream",
+		"redirect_http_status": 307,
+	},
 	{
 		"source": "/outbound/send-newsletter",
 		"target": "/api/method/mail.api.outbound.send_newsletter",
@@ -71,7 +76,7 @@ website_redirects = [
 
 # include js, css files in header of desk.html
 # app_include_css = "/assets/mail/css/mail.css"
-# app_include_js = "/assets/mail/js/mail.js"
+app_include_js = "mail.bundle.js"
 
 # include js, css files in header of web template
 # web_include_css = "/assets/mail/css/mail.css"
@@ -218,9 +223,15 @@ scheduler_events = {
 		"mail.mail.doctype.outgoing_mail.outgoing_mail.delete_newsletters",
 		"mail.mail.doctype.incoming_mail.incoming_mail.delete_rejected_mails",
 	],
+	"daily_long": [
+		"mail.utils.blob_store.delete_orphaned_blobs",
+	],
 	# "hourly": [
 	#     "mail.tasks.hourly"
 	# ],
+	"hourly_long": [
+		"mail.mail.doctype.dns_record.dns_record.verify_unverified_dns_records",
+	],
 	# "weekly": [
 	#     "mail.tasks.weekly"
 	# ],
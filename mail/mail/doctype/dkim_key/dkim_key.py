@@ -3,11 +3,18 @@
 
 import frappe
 from frappe.utils import cint
+from typing import TYPE_CHECKING
 from frappe import _, generate_hash
 from frappe.model.document import Document
-from frappe.utils.caching import request_cache
+from mail.utils.cache import delete_cache, get_dkim_signers_version
 from mail.mail.doctype.dns_record.dns_record import create_or_update_dns_record
 
+if TYPE_CHECKING:
+	from mail.utils.dkim_signer import DKIMSigner
+
+# Signers of the enabled DKIM Keys per site and domain, shared by all the requests and jobs of the process
+_dkim_signers: dict[tuple[str, str], tuple[tuple[str, str], list["DKIMSigner"]]] = {}
+
 
 class DKIMKey(Document):
 	def autoname(self) -> None:
@@ -19,14 +26,19 @@ class DKIMKey(Document):
 		self.generate_dkim_keys()
 
 	def after_insert(self) -> None:
+		# The existing keys keep signing until the DNS Record of this one is verified
 		self.create_or_update_dns_record()
-		self.disable_existing_dkim_keys()
-		self.delete_existing_dns_records()
+
+	def on_update(self) -> None:
+		if self.has_value_changed("enabled"):
+			clear_dkim_signers_cache(self.domain_name)
 
 	def on_trash(self) -> None:
 		if frappe.session.user != "Administrator":
 			frappe.throw(_("Only Administrator can delete DKIM Key."))
 
+		clear_dkim_signers_cache(self.domain_name)
+
 	def validate_domain_name(self) -> None:
 		"""Validates the Domain Name."""
 
@@ -36,7 +48,10 @@ class DKIMKey(Document):
 	def validate_key_size(self) -> None:
 		"""Validates the Key Size."""
 
-		if self.key_size:
+		if self.key_type == "Ed25519":
+			# Ed25519 keys have a fixed size
+			self.key_size = None
+		elif self.key_size:
 			if cint(self.key_size) < 1024:
 				frappe.throw(_("Key Size must be greater than 1024."))
 		else:
@@ -47,7 +62,7 @@ class DKIMKey(Document):
 	def generate_dkim_keys(self) -> None:
 		"""Generates the DKIM Keys."""
 
-		self.private_key, self.public_key = generate_dkim_keys(cint(self.key_size))
+		self.private_key, self.public_key = generate_dkim_keys(cint(self.key_size), self.key_type)
 
 	def create_or_update_dns_record(self) -> None:
 		"""Creates or Updates the DNS Record."""
@@ -55,7 +70,7 @@ class DKIMKey(Document):
 		create_or_update_dns_record(
 			host=f"{self.name}._domainkey",
 			type="TXT",
-			value=f"v=DKIM1; k=rsa; p={self.public_key}",
+			value=f"v=DKIM1; k={self.key_type.lower()}; p={self.public_key}",
 			category="Sending Record",
 			attached_to_doctype=self.doctype,
 			attached_to_docname=self.name,
@@ -72,15 +87,33 @@ class DKIMKey(Document):
 				(DKIM_KEY.enabled == 1)
 				& (DKIM_KEY.name != self.name)
 				& (DKIM_KEY.domain_name == self.domain_name)
+				& (DKIM_KEY.key_type == self.key_type)
+				& (DKIM_KEY.creation < self.creation)
 			)
 		).run()
+		clear_dkim_signers_cache(self.domain_name)
+
+	def on_dns_record_verified(self) -> None:
+		"""Retires the existing DKIM Keys once the DNS Record of this key is verified."""
+
+		if self.enabled:
+			self.disable_existing_dkim_keys()
+			self.delete_existing_dns_records()
+
+		# The key signs from now on
+		clear_dkim_signers_cache(self.domain_name)
 
 	def delete_existing_dns_records(self) -> None:
 		"""Deletes the existing DNS Records."""
 
 		existing_dkim_keys = frappe.db.get_all(
 			"DKIM Key",
-			filters={"enabled": 0, "name": ["!=", self.name], "domain_name": self.domain_name},
+			filters={
+				"enabled": 0,
+				"name": ["!=", self.name],
+				"domain_name": self.domain_name,
+				"key_type": self.key_type,
+			},
 			pluck="name",
 		)
 		existing_dns_records = frappe.db.get_all(
@@ -96,12 +129,15 @@ class DKIMKey(Document):
 			frappe.delete_doc("DNS Record", dns_record, ignore_permissions=True)
 
 
-def create_dkim_key(domain_name: str, key_size: int | None = None) -> "DKIMKey":
+def create_dkim_key(
+	domain_name: str, key_size: int | None = None, key_type: str = "RSA"
+) -> "DKIMKey":
 	"""Creates a DKIM Key document."""
 
 	doc = frappe.new_doc("DKIM Key")
 	doc.enabled = 1
 	doc.domain_name = domain_name
+	doc.key_type = key_type
 	doc.key_size = key_size
 	doc.flags.ignore_links = True
 	doc.save(ignore_permissions=True)
@@ -109,25 +145,62 @@ def create_dkim_key(domain_name: str, key_size: int | None = None) -> "DKIMKey":
 	return doc
 
 
-@request_cache
-def get_dkim_selector_and_private_key(
-	domain_name: str, raise_exception: bool = True
-) -> tuple[str | None, str | None]:
-	"""Returns the DKIM selector and private key for the given domain."""
+def get_dkim_signers(domain_name: str) -> list["DKIMSigner"]:
+	"""Returns the signers of the enabled DKIM Keys of the domain whose DNS Record is verified, one per key type.
 
-	selector, private_key = frappe.db.get_value(
-		"DKIM Key", {"enabled": 1, "domain_name": domain_name}, ["name", "private_key"]
-	)
+	A key does not sign until its DNS Record is verified, the signature would fail for the receivers.
+	"""
+
+	from mail.utils.dkim_signer import DKIMSigner
+	from mail.utils.cache import get_root_domain_name
+
+	cache_key = (frappe.local.site, domain_name)
+	version = (get_dkim_signers_version(domain_name), get_root_domain_name())
 
-	if raise_exception and (not selector or not private_key):
+	if (cached := _dkim_signers.get(cache_key)) and cached[0] == version:
+		return cached[1]
+
+	DKIM_KEY = frappe.qb.DocType("DKIM Key")
+	DNS_RECORD = frappe.qb.DocType("DNS Record")
+	dkim_keys = (
+		frappe.qb.from_(DKIM_KEY)
+		.join(DNS_RECORD)
+		.on(
+			(DNS_RECORD.attached_to_doctype == "DKIM Key")
+			& (DNS_RECORD.attached_to_docname == DKIM_KEY.name)
+		)
+		.select(DKIM_KEY.name, DKIM_KEY.private_key)
+		.where(
+			(DKIM_KEY.enabled == 1)
+			& (DKIM_KEY.domain_name == domain_name)
+			& (DNS_RECORD.is_verified == 1)
+		)
+		.orderby(DKIM_KEY.creation, order=frappe.qb.desc)
+	).run(as_dict=True)
+
+	if not dkim_keys:
 		frappe.throw(
-			_("DKIM Key not found for the domain {0}").format(frappe.bold(domain_name))
+			_("No DKIM Key with a verified DNS Record found for the domain {0}").format(
+				frappe.bold(domain_name)
+			)
 		)
 
-	return selector, private_key
+	signers = [
+		DKIMSigner(domain=version[1], selector=dkim_key.name, private_key=dkim_key.private_key)
+		for dkim_key in dkim_keys
+	]
+	_dkim_signers[cache_key] = (version, signers)
+
+	return signers
 
 
-def generate_dkim_keys(key_size: int = 1024) -> tuple[str, str]:
+def clear_dkim_signers_cache(domain_name: str) -> None:
+	"""Invalidates the cached signers of the domain in all the processes once the transaction is committed."""
+
+	frappe.db.after_commit.add(lambda: delete_cache("dkim_signers_version", domain_name))
+
+
+def generate_dkim_keys(key_size: int = 1024, key_type: str = "RSA") -> tuple[str, str]:
 	"""Generates the DKIM Keys."""
 
 	def get_filtered_dkim_key(key_pem: str) -> str:
@@ -143,9 +216,24 @@ def generate_dkim_keys(key_size: int = 1024) -> tuple[str, str]:
 
 		return key_pem
 
+	from base64 import b64encode
 	from cryptography.hazmat.backends import default_backend
 	from cryptography.hazmat.primitives import serialization
-	from cryptography.hazmat.primitives.asymmetric import rsa
+	from cryptography.hazmat.primitives.asymmetric import rsa, ed25519
+
+	if key_type == "Ed25519":
+		private_key = ed25519.Ed25519PrivateKey.generate()
+		private_key_pem = private_key.private_bytes(
+			encoding=serialization.Encoding.PEM,
+			format=serialization.PrivateFormat.PKCS8,
+			encryption_algorithm=serialization.NoEncryption(),
+		).decode()
+		# The DNS record holds the raw 32 byte public key (RFC 8463)
+		public_key = private_key.public_key().public_bytes(
+			encoding=serialization.Encoding.Raw, format=serialization.PublicFormat.Raw
+		)
+
+		return private_key_pem, b64encode(public_key).decode()
 
 	private_key = rsa.generate_private_key(
 		public_exponent=65537, key_size=key_size, backend=default_backend()
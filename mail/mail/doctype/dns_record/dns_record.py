@@ -14,11 +14,20 @@ class DNSRecord(Document):
 		if self.is_new():
 			self.validate_duplicate_record()
 			self.validate_ttl()
+		elif self.has_value_changed("value"):
+			# The new value is verified once it resolves, see `verify_unverified_dns_records`
+			self.is_verified = 0
 
 	def on_update(self) -> None:
 		if self.has_value_changed("value") or self.has_value_changed("ttl"):
 			self.create_or_update_record_in_dns_provider()
-			self.reload()
+
+		if (
+			self.is_verified
+			and self.has_value_changed("is_verified")
+			and self.attached_to_doctype == "DKIM Key"
+		):
+			frappe.get_doc(self.attached_to_doctype, self.attached_to_docname).on_dns_record_verified()
 
 	def on_trash(self) -> None:
 		self.delete_record_from_dns_provider()
@@ -44,24 +53,22 @@ class DNSRecord(Document):
 	def create_or_update_record_in_dns_provider(self) -> None:
 		"""Creates or Updates the DNS Record in the DNS Provider"""
 
-		result = False
 		mail_settings = frappe.get_single("Mail Settings")
 
-		if mail_settings.dns_provider and mail_settings.dns_provider_token:
-			dns_provider = DNSProvider(
-				provider=mail_settings.dns_provider,
-				token=mail_settings.get_password("dns_provider_token"),
-			)
-			result = dns_provider.create_or_update_dns_record(
-				domain=mail_settings.root_domain_name,
-				type=self.type,
-				host=self.host,
-				value=self.value,
-				ttl=self.ttl,
-			)
+		if not mail_settings.dns_provider or not mail_settings.dns_provider_token:
+			return
 
-		frappe.db.set_value(
-			self.doctype, self.name, {"is_verified": int(result), "last_checked_at": now()}
+		# Not verified here, the record may take a while to propagate after the DNS Provider accepts it
+		dns_provider = DNSProvider(
+			provider=mail_settings.dns_provider,
+			token=mail_settings.get_password("dns_provider_token"),
+		)
+		dns_provider.create_or_update_dns_record(
+			domain=mail_settings.root_domain_name,
+			type=self.type,
+			host=self.host,
+			value=self.value,
+			ttl=self.ttl,
 		)
 
 	def delete_record_from_dns_provider(self) -> None:
@@ -156,6 +163,15 @@ def verify_all_dns_records() -> None:
 		dns_record.verify_dns_record(save=True)
 
 
+def verify_unverified_dns_records() -> None:
+	"""Verifies the DNS Records that are not verified yet, e.g. the ones just created in the DNS Provider."""
+
+	dns_records = frappe.db.get_all("DNS Record", filters={"is_verified": 0}, pluck="name")
+	for dns_record in dns_records:
+		dns_record = frappe.get_doc("DNS Record", dns_record)
+		dns_record.verify_dns_record(save=True)
+
+
 @frappe.whitelist()
 def enqueue_verify_all_dns_records() -> None:
 	"Called by the scheduler to enqueue the `verify_all_dns_records` job."
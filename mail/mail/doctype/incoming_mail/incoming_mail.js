@@ -5,6 +5,7 @@ frappe.ui.form.on("Incoming Mail", {
 	refresh(frm) {
         frm.trigger("set_queries");
         frm.trigger("add_actions");
+        mail.render_compressed_fields(frm);
 	},
 
     add_actions(frm) {
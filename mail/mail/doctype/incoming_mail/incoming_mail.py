@@ -4,11 +4,15 @@
 import frappe
 from frappe import _
 from uuid_utils import uuid7
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Any
 from email.utils import parseaddr
 from frappe.model.document import Document
 from mail.utils.cache import get_postmaster
-from mail.rabbitmq import rabbitmq_context
+from mail.utils.compression import CompressedField, set_decompressed_onload
+from mail.utils.blob_store import delete_blobs, get_message_blobs
+from mail.config.constants import INCOMING_MAIL_QUEUE
+from mail.rabbitmq import RabbitMQConsumer, rabbitmq_context
+from mail.utils.realtime import notify_mail_event
 from mail.utils.email_parser import EmailParser, extract_ip_and_host
 from mail.mail.doctype.mail_contact.mail_contact import create_mail_contact
 from mail.mail.doctype.outgoing_mail.outgoing_mail import create_outgoing_mail
@@ -16,6 +20,7 @@ from frappe.utils import now, cint, time_diff_in_seconds, validate_email_address
 from mail.mail.doctype.spam_check_log.spam_check_log import create_spam_check_log
 from mail.utils import (
 	enqueue_job,
+	delete_attachments,
 	parse_iso_datetime,
 	get_in_reply_to_mail,
 )
@@ -28,13 +33,19 @@ from mail.utils.user import (
 
 
 if TYPE_CHECKING:
+	from pika.adapters.blocking_connection import BlockingChannel
 	from mail.mail.doctype.outgoing_mail.outgoing_mail import OutgoingMail
 
 
 class IncomingMail(Document):
+	message = CompressedField(blob_field="message_blob")
+
 	def autoname(self) -> None:
 		self.name = str(uuid7())
 
+	def onload(self) -> None:
+		set_decompressed_onload(self)
+
 	def validate(self) -> None:
 		if self.get("_action") == "submit":
 			self.spam_check()
@@ -48,12 +59,15 @@ class IncomingMail(Document):
 		if frappe.session.user != "Administrator":
 			frappe.throw(_("Only Administrator can delete Incoming Mail."))
 
+		delete_blobs([self.message_blob])
+
 	def spam_check(self) -> None:
 		"""Checks if the mail is spam."""
 
 		mail_settings = frappe.get_cached_doc("Mail Settings")
 		if mail_settings.enable_spam_detection and mail_settings.scan_incoming_mail:
-			spam_log = create_spam_check_log(self.message)
+			# Stored as is if the message is already compressed
+			spam_log = create_spam_check_log(self.get("message") or self.message)
 			self.spam_score = spam_log.spam_score
 			self.spam_check_response = spam_log.spamd_response
 			self.is_spam = cint(self.spam_score > mail_settings.max_spam_score_for_inbound)
@@ -110,9 +124,7 @@ class IncomingMail(Document):
 	def sync_with_frontend(self) -> None:
 		"""Syncs the Incoming Mail with the frontend."""
 
-		frappe.publish_realtime(
-			"incoming_mail_received", self.as_dict(), user=self.receiver, after_commit=True
-		)
+		notify_mail_event("incoming_mail_received", self.receiver, self.doctype, self)
 
 
 @frappe.whitelist()
@@ -163,7 +175,13 @@ def delete_incoming_mails(mailbox: str) -> None:
 		frappe.throw(_("Only System Manager can delete Incoming Mails."))
 
 	if mailbox:
+		incoming_mails = frappe.db.get_all(
+			"Incoming Mail", filters={"receiver": mailbox}, pluck="name"
+		)
+		message_blobs = get_message_blobs("Incoming Mail", {"receiver": mailbox})
 		frappe.db.delete("Incoming Mail", {"receiver": mailbox})
+		delete_attachments("Incoming Mail", incoming_mails)
+		delete_blobs(message_blobs)
 
 
 def delete_rejected_mails() -> None:
@@ -176,15 +194,22 @@ def delete_rejected_mails() -> None:
 		"Mail Settings", "rejected_mail_retention", cache=True
 	)
 	IM = frappe.qb.DocType("Incoming Mail")
-	(
+	rejected_mails = (
 		frappe.qb.from_(IM)
+		.select(IM.name)
 		.where(
 			(IM.docstatus != 0)
 			& (IM.is_rejected == 1)
 			& (IM.processed_at < (Now() - Interval(days=retention_days)))
 		)
-		.delete()
-	).run()
+	).run(pluck="name")
+
+	for i in range(0, len(rejected_mails), 1000):
+		names = rejected_mails[i : i + 1000]
+		message_blobs = get_message_blobs("Incoming Mail", {"name": ["in", names]})
+		frappe.db.delete("Incoming Mail", {"name": ["in", names]})
+		delete_attachments("Incoming Mail", names)
+		delete_blobs(message_blobs)
 
 
 def has_permission(doc: "Document", ptype: str, user: str) -> bool:
@@ -305,70 +330,70 @@ def create_incoming_mail(
 	return doc
 
 
-def get_incoming_mails() -> None:
-	"""Gets incoming mails from the RabbitMQ."""
+def process_incoming_mail(agent: str, message: str) -> None:
+	"""Processes the incoming mail message."""
 
-	def process_incoming_mail(agent: str, message: str) -> None:
-		"""Processes the incoming mail message."""
+	parsed_message = EmailParser.get_parsed_message(message)
+	receiver = parsed_message.get("Delivered-To")
+	display_name, sender = parseaddr(parsed_message.get("From"))
 
-		parsed_message = EmailParser.get_parsed_message(message)
-		receiver = parsed_message.get("Delivered-To")
-		display_name, sender = parseaddr(parsed_message.get("From"))
+	if not (validate_email_address(sender) == sender) or not (
+		validate_email_address(receiver) == receiver
+	):
+		frappe.log_error(title="Invalid Email Address", message=message)
+		return
 
-		if not (validate_email_address(sender) == sender) or not (
-			validate_email_address(receiver) == receiver
-		):
-			frappe.log_error(title="Invalid Email Address", message=message)
-			return
-
-		domain_name = receiver.split("@")[1]
-
-		if not is_active_domain(domain_name):
-			log_rejected_mail(agent, receiver, message)
-			return
-
-		if is_mail_alias(receiver):
-			mail_alias = frappe.get_cached_doc("Mail Alias", receiver)
-			if mail_alias.enabled:
-				for mailbox in mail_alias.mailboxes:
-					if is_active_mailbox(mailbox.mailbox):
-						create_incoming_mail(agent, mailbox.mailbox, message)
-		elif is_active_mailbox(receiver):
-			create_incoming_mail(agent, receiver, message)
-			return
-
-		# If not accepted by alias or mailbox, reject the email
+	domain_name = receiver.split("@")[1]
+
+	if not is_active_domain(domain_name):
 		log_rejected_mail(agent, receiver, message)
+		return
+
+	if is_mail_alias(receiver):
+		mail_alias = frappe.get_cached_doc("Mail Alias", receiver)
+		if mail_alias.enabled:
+			for mailbox in mail_alias.mailboxes:
+				if is_active_mailbox(mailbox.mailbox):
+					create_incoming_mail(agent, mailbox.mailbox, message)
+	elif is_active_mailbox(receiver):
+		create_incoming_mail(agent, receiver, message)
+		return
+
+	# If not accepted by alias or mailbox, reject the email
+	log_rejected_mail(agent, receiver, message)
+
+
+def log_rejected_mail(agent: str, receiver: str, message: str) -> None:
+	"""Logs the rejected mail."""
+
+	incoming_mail = create_incoming_mail(
+		agent,
+		receiver,
+		message,
+		is_rejected=1,
+		rejection_message="550 5.4.1 Recipient address rejected: Access denied.",
+	)
 
-	def log_rejected_mail(agent: str, receiver: str, message: str) -> None:
-		"""Logs the rejected mail."""
+	if incoming_mail.docstatus == 1 and frappe.db.get_single_value(
+		"Mail Settings", "send_notification_on_reject", cache=True
+	):
+		try:
+			create_outgoing_mail(
+				sender=get_postmaster(),
+				to=incoming_mail.reply_to or incoming_mail.sender,
+				display_name="Mail Delivery System",
+				subject=f"Undeliverable: {incoming_mail.subject}",
+				body_html=get_rejected_template(incoming_mail),
+			)
+		except Exception:
+			frappe.log_error(
+				title="Send Rejection Notification",
+				message=frappe.get_traceback(with_context=False),
+			)
 
-		incoming_mail = create_incoming_mail(
-			agent,
-			receiver,
-			message,
-			is_rejected=1,
-			rejection_message="550 5.4.1 Recipient address rejected: Access denied.",
-		)
 
-		if incoming_mail.docstatus == 1 and frappe.db.get_single_value(
-			"Mail Settings", "send_notification_on_reject", cache=True
-		):
-			try:
-				create_outgoing_mail(
-					sender=get_postmaster(),
-					to=incoming_mail.reply_to or incoming_mail.sender,
-					display_name="Mail Delivery System",
-					subject=f"Undeliverable: {incoming_mail.subject}",
-					body_html=get_rejected_template(incoming_mail),
-				)
-			except Exception:
-				frappe.log_error(
-					title="Send Rejection Notification",
-					message=frappe.get_traceback(with_context=False),
-				)
-
-	from mail.config.constants import INCOMING_MAIL_QUEUE
+def get_incoming_mails() -> None:
+	"""Gets incoming mails from the RabbitMQ."""
 
 	frappe.session.user = get_postmaster()
 
@@ -395,6 +420,29 @@ def get_incoming_mails() -> None:
 		)
 
 
+class IncomingMailConsumer(RabbitMQConsumer):
+	"""Creates the incoming mails as soon as they are pushed by RabbitMQ."""
+
+	queue = INCOMING_MAIL_QUEUE
+	prefetch_count = 50
+
+	def on_message(
+		self, channel: "BlockingChannel", method: Any, properties: Any, body: bytes
+	) -> None:
+		if body:
+			process_incoming_mail(properties.app_id, body.decode("utf-8"))
+
+		frappe.db.commit()
+		channel.basic_ack(delivery_tag=method.delivery_tag)
+
+
+def run_incoming_mail_consumer() -> None:
+	"""Consumes the incoming mails queue until the process is stopped."""
+
+	frappe.session.user = get_postmaster()
+	IncomingMailConsumer().run()
+
+
 @frappe.whitelist()
 def enqueue_get_incoming_mails() -> None:
 	"Called by the scheduler to enqueue the `get_incoming_mails` job."
@@ -0,0 +1,50 @@
+# Copyright (c) 2026, Frappe Technologies Pvt. Ltd. and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.utils import now
+from uuid_utils import uuid7
+from frappe.model.document import Document
+
+
+class MailDeliveryEvent(Document):
+	def autoname(self) -> None:
+		self.name = str(uuid7())
+
+
+def insert_mail_delivery_events(events: list[dict]) -> None:
+	"""Appends the delivery events of the recipients of Outgoing Mails with a single insert."""
+
+	if not events:
+		return
+
+	fields = ["outgoing_mail", "recipient", "status", "retries", "action_at", "details"]
+	timestamp = now()
+	user = frappe.session.user
+
+	# Time ordered names, so that the rows are appended at the end of the primary key
+	frappe.db.bulk_insert(
+		"Mail Delivery Event",
+		fields=["name", "creation", "modified", "owner", "modified_by", *fields],
+		values=[
+			[str(uuid7()), timestamp, timestamp, user, user, *(event.get(field) for field in fields)]
+			for event in events
+		],
+	)
+
+
+def delete_mail_delivery_events(outgoing_mails: list[str], chunk_size: int = 1000) -> None:
+	"""Deletes the delivery events of the given Outgoing Mails."""
+
+	for i in range(0, len(outgoing_mails), chunk_size):
+		frappe.db.delete(
+			"Mail Delivery Event", {"outgoing_mail": ["in", outgoing_mails[i : i + chunk_size]]}
+		)
+
+
+def on_doctype_update():
+	frappe.db.add_index(
+		"Mail Delivery Event",
+		["outgoing_mail", "recipient", "action_at"],
+		"outgoing_mail_recipient_action_at_index",
+	)
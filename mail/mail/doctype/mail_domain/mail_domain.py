@@ -27,6 +27,11 @@ class MailDomain(Document):
 
 		if self.is_new() or self.has_value_changed("dkim_key_size"):
 			create_dkim_key(self.domain_name, cint(self.dkim_key_size))
+
+			if self.is_new():
+				# Mails are signed with both keys, receivers without Ed25519 support verify the RSA one
+				create_dkim_key(self.domain_name, key_type="Ed25519")
+
 			self.refresh_dns_records()
 		elif not self.enabled:
 			self.is_verified = 0
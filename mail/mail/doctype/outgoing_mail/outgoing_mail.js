@@ -11,6 +11,7 @@ frappe.ui.form.on("Outgoing Mail", {
         frm.trigger("add_comments");
         frm.trigger("add_actions");
         frm.trigger("set_sender");
+        mail.render_compressed_fields(frm);
 	},
 
     set_queries(frm) {
@@ -35,7 +36,12 @@ frappe.ui.form.on("Outgoing Mail", {
     },
 
     add_actions(frm) {
-        if (frm.doc.docstatus === 1) {
+        if (frm.doc.docstatus === 0 && frm.doc.status === "Failed" && !frm.doc.__islocal) {
+            frm.add_custom_button(__("Retry"), () => {
+                frm.trigger("retry_failed_mail");
+            }, __("Actions"));
+        }
+        else if (frm.doc.docstatus === 1) {
             if (frm.doc.status === "Pending") {
                 frm.add_custom_button(__("Transfer Now"), () => {
                     frm.trigger("transfer_now");
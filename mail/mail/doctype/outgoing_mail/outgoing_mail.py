@@ -2,6 +2,7 @@
 # For license information, please see license.txt
 
 import json
+import time
 import frappe
 from frappe import _
 from re import finditer
@@ -10,25 +11,59 @@ from uuid_utils import uuid7
 from mail.config import constants
 from email.message import Message
 from email.mime.text import MIMEText
-from mail.rabbitmq import rabbitmq_context
+from mail.utils.mime import MIMEWriter
+from mail.utils.realtime import notify_mail_event
+from mail.rabbitmq import RabbitMQConsumer, rabbitmq_context
 from frappe.model.document import Document
-from mail.utils.cache import get_postmaster
+from mail.utils.cache import (
+	get_postmaster,
+	get_outgoing_mails_by_queue_id,
+	set_outgoing_mails_by_queue_id,
+)
+from mail.utils.blob_store import (
+	delete_blobs,
+	get_new_blobs,
+	discard_new_blobs,
+	get_message_blobs,
+)
+from mail.utils.compression import CompressedField, load_value, set_decompressed_onload
 from email.utils import parseaddr, formataddr
+from typing import TYPE_CHECKING, Any, Generator
 from email.mime.multipart import MIMEMultipart
-from frappe.utils import flt, now, cint, time_diff_in_seconds
+from frappe.utils import flt, now, cint, add_to_date, time_diff_in_seconds
 from mail.mail.doctype.spam_check_log.spam_check_log import create_spam_check_log
+from mail.mail.doctype.mail_delivery_event.mail_delivery_event import (
+	delete_mail_delivery_events,
+	insert_mail_delivery_events,
+)
 from mail.utils.user import is_mailbox_owner, is_system_manager, get_user_mailboxes
 from mail.utils import (
+	bulk_update,
 	enqueue_job,
+	delete_attachments,
 	parse_iso_datetime,
+	reset_local_caches,
 	convert_html_to_text,
+	rollback_or_reconnect,
 )
 
+if TYPE_CHECKING:
+	from frappe.core.doctype.file.file import File
+	from pypika.queries import QueryBuilder
+	from jinja2 import Template
+	from pika.adapters.blocking_connection import BlockingChannel
+
 
 class OutgoingMail(Document):
+	message = CompressedField(blob_field="message_blob")
+	raw_message = CompressedField()
+
 	def autoname(self) -> None:
 		self.name = str(uuid7())
 
+	def onload(self) -> None:
+		set_decompressed_onload(self)
+
 	def validate(self) -> None:
 		self.validate_amended_doc()
 		self.validate_folder()
@@ -50,8 +85,14 @@ class OutgoingMail(Document):
 				self.set_body_plain()
 
 			self.generate_message()
-			self.validate_max_message_size()
-			self.spam_check()
+
+			# Validated by `build_messages_in_pool` once the message is built
+			if not self.flags.defer_message_build:
+				self.validate_message()
+
+		# Last, so that a mail that fails validation does not use up the quota
+		if not self.flags.defer_message_build:
+			self.validate_rate_limit()
 
 	def on_submit(self) -> None:
 		self.create_mail_contacts()
@@ -65,6 +106,8 @@ class OutgoingMail(Document):
 			frappe.enqueue_doc(
 				"Outgoing Mail", self.name, "transfer_now", enqueue_after_commit=True
 			)
+		else:
+			notify_transfer_daemon()
 
 	def on_update_after_submit(self) -> None:
 		self.validate_folder()
@@ -73,6 +116,9 @@ class OutgoingMail(Document):
 		if self.docstatus != 0 and frappe.session.user != "Administrator":
 			frappe.throw(_("Only Administrator can delete Outgoing Mail."))
 
+		delete_blobs([self.message_blob])
+		delete_mail_delivery_events([self.name])
+
 	def validate_amended_doc(self) -> None:
 		"""Validates the amended document."""
 
@@ -98,7 +144,7 @@ class OutgoingMail(Document):
 
 		if self.via_api:
 			if status == "Sent":
-				frappe.publish_realtime("outgoing_mail_sent", self.as_dict(), after_commit=True)
+				notify_mail_event("outgoing_mail_sent", self.sender, self.doctype, self)
 
 	def load_runtime(self) -> None:
 		"""Loads the runtime properties."""
@@ -134,6 +180,14 @@ class OutgoingMail(Document):
 
 		validate_mailbox_for_outgoing(self.sender)
 
+	def validate_rate_limit(self) -> None:
+		"""Validates the rate limit of the user, mailbox and domain for mails sent via API."""
+
+		if self.is_new() and self.via_api and not self.is_newsletter:
+			from mail.utils.rate_limiter import check_rate_limit
+
+			check_rate_limit(frappe.session.user, self.sender, self.domain_name)
+
 	def validate_in_reply_to(self) -> None:
 		"""Validates the In Reply To."""
 
@@ -285,7 +339,8 @@ class OutgoingMail(Document):
 	def set_ip_address(self) -> None:
 		"""Sets the IP Address."""
 
-		self.ip_address = frappe.local.request_ip
+		# Mails submitted in the background already carry the IP Address of the request
+		self.ip_address = self.ip_address or frappe.local.request_ip
 
 	def set_message_id(self) -> None:
 		"""Sets the Message ID."""
@@ -387,90 +442,90 @@ class OutgoingMail(Document):
 				for header in self.custom_headers:
 					message.add_header(header.key, header.value)
 
-		def _add_attachments(message: MIMEMultipart | Message) -> None:
-			"""Adds the attachments to the message."""
+		def _add_attachments(writer: MIMEWriter) -> None:
+			"""Adds the attachments to the message, their content is encoded from the files while writing."""
 
 			from mimetypes import guess_type
-			from email.mime.base import MIMEBase
-			from email.mime.audio import MIMEAudio
-			from email.mime.image import MIMEImage
-			from email.encoders import encode_base64
-
-			for attachment in self.attachments:
-				file = frappe.get_doc("File", attachment.get("name"))
-				content_type = guess_type(file.file_name)[0]
 
-				if content_type is None:
-					content_type = "application/octet-stream"
+			def _get_source(file: "File") -> str | bytes:
+				"""Returns the path of the file, or its content if it is not stored on the disk."""
 
-				content = file.get_content()
-				maintype, subtype = content_type.split("/", 1)
+				if file.is_remote_file:
+					content = file.get_content()
+					return content.encode("utf-8") if isinstance(content, str) else content
 
-				if maintype == "text":
-					if isinstance(content, str):
-						content = content.encode("utf-8")
-					part = MIMEText(content, _subtype=subtype, _charset="utf-8", policy=policy.SMTP)
+				return file.get_full_path()
 
-				elif maintype == "image":
-					part = MIMEImage(content, _subtype=subtype, policy=policy.SMTP)
-
-				elif maintype == "audio":
-					part = MIMEAudio(content, _subtype=subtype, policy=policy.SMTP)
-
-				else:
-					part = MIMEBase(maintype, subtype, policy=policy.SMTP)
-					part.set_payload(content)
-					encode_base64(part)
-
-				part.add_header(
-					"Content-Disposition", f'{attachment.type}; filename="{file.file_name}"'
+			for attachment in self.attachments:
+				file = frappe.get_doc("File", attachment.get("name"))
+				content_type = guess_type(file.file_name)[0] or "application/octet-stream"
+
+				writer.attach(
+					_get_source(file),
+					content_type=content_type,
+					filename=file.file_name,
+					disposition=attachment.type,
+					content_id=attachment.name,
+					content_hash=file.content_hash,
 				)
-				part.add_header("Content-ID", f"<{attachment.name}>")
-
-				message.attach(part)
-
-		def _add_dkim_signature(message: MIMEMultipart | Message) -> None:
-			"""Adds the DKIM signature to the message."""
-
-			from dkim import sign as dkim_sign
-			from mail.utils.cache import get_root_domain_name
-			from mail.mail.doctype.dkim_key.dkim_key import get_dkim_selector_and_private_key
-
-			include_headers = [
-				b"To",
-				b"Cc",
-				b"From",
-				b"Date",
-				b"Subject",
-				b"Reply-To",
-				b"Message-ID",
-				b"In-Reply-To",
-			]
-			dkim_selector, dkim_private_key = get_dkim_selector_and_private_key(self.domain_name)
-			dkim_signature = dkim_sign(
-				message=message.as_string().split("\n", 1)[-1].encode("utf-8"),
-				domain=get_root_domain_name().encode(),
-				selector=dkim_selector.encode(),
-				privkey=dkim_private_key.encode(),
-				include_headers=include_headers,
-			)
-			dkim_header = dkim_signature.decode().replace("\n", "").replace("\r", "")
-			message["DKIM-Signature"] = dkim_header[len("DKIM-Signature: ") :]
 
 		from frappe.utils import get_datetime_str
 		from mail.utils import parsedate_to_datetime
+		from mail.utils.message_builder import build_message
+		from mail.utils.part_cache import get_encoded_part_cache
+		from mail.mail.doctype.dkim_key.dkim_key import get_dkim_signers
 
 		message = _get_message()
 		_add_headers(message)
-		_add_attachments(message)
-		_add_dkim_signature(message)
 
-		self.message = message.as_string()
-		self.message_size = len(self.message)
+		writer = MIMEWriter(message, cache=get_encoded_part_cache())
+		_add_attachments(writer)
+
+		include_headers = [
+			"To",
+			"Cc",
+			"From",
+			"Date",
+			"Subject",
+			"Reply-To",
+			"Message-ID",
+			"In-Reply-To",
+		]
+		self._flattened_message = writer.flatten()
+		build_args = (
+			self._flattened_message,
+			get_dkim_signers(self.domain_name),
+			include_headers,
+			writer.cache,
+		)
+
+		if self.flags.defer_message_build:
+			# Built and signed in the process pool by `build_messages_in_pool`
+			self._message_build_args = build_args
+		else:
+			self.set_message(build_message(*build_args))
+
 		self.created_at = get_datetime_str(parsedate_to_datetime(message["Date"]))
 		self.submitted_at = now()
 		self.submitted_after = time_diff_in_seconds(self.submitted_at, self.created_at)
 
+	def set_message(self, message: bytes) -> None:
+		"""Sets the Message and its size from the serialized message."""
+
+		# The serialized message is kept for the spam check, so that it is not encoded again
+		self._message_bytes = message
+		self.message = message
+		self.message_size = len(message)
+
+	def validate_message(self) -> None:
+		"""Validates the size and the spam score of the generated message."""
+
+		self.validate_max_message_size()
+		self.spam_check()
+
+		# The buffers are only needed for the checks above
+		self._message_bytes = self._flattened_message = None
+
 	def validate_max_message_size(self) -> None:
 		"""Validates the maximum message size."""
 
@@ -487,13 +542,18 @@ class OutgoingMail(Document):
 	def spam_check(self) -> None:
 		"""Checks if the mail is spam."""
 
-		# Skip spam check for bulk emails as it may slow down the insertion
-		if frappe.flags.bulk_insert:
+		# Skip spam check for bulk newsletters as it may slow down the insertion
+		if frappe.flags.bulk_insert and self.is_newsletter:
 			return
 
 		mail_settings = self.runtime.mail_settings
 		if mail_settings.enable_spam_detection and mail_settings.scan_outgoing_mail:
-			spam_log = create_spam_check_log(self.message)
+			spam_log = create_spam_check_log(
+				# Stored as is if the message is already compressed
+				self.get("message") or self.message,
+				raw_message=self._message_bytes,
+				message_without_attachments=self._flattened_message.get_message_without_attachments(),
+			)
 			self.spam_score = spam_log.spam_score
 			self.spam_check_response = spam_log.spamd_response
 			self.is_spam = cint(self.spam_score > mail_settings.max_spam_score_for_outbound)
@@ -516,23 +576,7 @@ class OutgoingMail(Document):
 		"""Updates the status based on the recipients status."""
 
 		if not status:
-			sent_count = 0
-			deferred_count = 0
-
-			for r in self.recipients:
-				if r.status == "Sent":
-					sent_count += 1
-				elif r.status == "Deferred":
-					deferred_count += 1
-
-			if sent_count == len(self.recipients):
-				status = "Sent"
-			elif sent_count > 0:
-				status = "Partially Sent"
-			elif deferred_count == len(self.recipients):
-				status = "Deferred"
-			else:
-				status = "Bounced"
+			status = get_status_from_recipients([r.status for r in self.recipients])
 
 		self.status = status
 
@@ -588,7 +632,8 @@ class OutgoingMail(Document):
 					"fname": filename,
 					"content": content,
 					"is_private": 1,
-					"decode": True,
+					# Content already decoded by the caller (e.g. newsletter templates) is passed as bytes
+					"decode": not isinstance(content, bytes),
 				}
 				file = save_file(**kwargs)
 
@@ -675,11 +720,48 @@ class OutgoingMail(Document):
 		if notify_update:
 			self.notify_update()
 
+	def enqueue_submit(self) -> None:
+		"""Enqueues the submission of the mail."""
+
+		frappe.enqueue_doc(
+			self.doctype, self.name, "submit_now", queue="short", enqueue_after_commit=True
+		)
+
+	def submit_now(self) -> None:
+		"""Submits the mail, called by the background job enqueued by `enqueue_submit`."""
+
+		self.load_from_db()
+
+		if self.docstatus != 0:
+			return
+
+		try:
+			self.submit()
+		except Exception:
+			frappe.db.rollback()
+			frappe.clear_messages()
+			error_log = frappe.get_traceback(with_context=False)
+			self.load_from_db()
+			self._db_set(status="Failed", error_log=error_log, commit=True, notify_update=True)
+
+			if self.via_api:
+				frappe.publish_realtime(
+					"outgoing_mail_failed",
+					{"name": self.name, "status": self.status, "error_log": error_log},
+					user=self.owner,
+				)
+
 	@frappe.whitelist()
 	def retry_failed_mail(self) -> None:
-		"""Retries the failed mail."""
+		"""Retries the failed mail, its submission if it failed to submit, see `submit_now`."""
 
-		if self.docstatus == 1 and self.status == "Failed":
+		if self.status != "Failed":
+			return
+
+		if self.docstatus == 0:
+			self._db_set(status="Draft", error_log=None, notify_update=True)
+			self.enqueue_submit()
+		elif self.docstatus == 1:
 			self._db_set(status="Pending", error_log=None, commit=True)
 			self.transfer_now()
 
@@ -724,7 +806,10 @@ class OutgoingMail(Document):
 		try:
 			with rabbitmq_context() as rmq:
 				rmq.declare_queue(constants.OUTGOING_MAIL_QUEUE, max_priority=3)
-				rmq.publish(constants.OUTGOING_MAIL_QUEUE, json.dumps(data), priority=3)
+				(acked,) = rmq.publish_many(constants.OUTGOING_MAIL_QUEUE, [(json.dumps(data), 3)])
+
+			if not acked:
+				frappe.throw(_("The mail was not confirmed by RabbitMQ."))
 
 			transfer_completed_at = now()
 			transfer_completed_after = time_diff_in_seconds(
@@ -857,6 +942,7 @@ def create_outgoing_mail(
 	is_newsletter: int = 0,
 	do_not_save: bool = False,
 	do_not_submit: bool = False,
+	submit_in_background: bool = False,
 ) -> "OutgoingMail":
 	"""Creates the outgoing mail."""
 
@@ -884,17 +970,26 @@ def create_outgoing_mail(
 			doc.sender = get_user_default_mailbox(user)
 
 	if not do_not_save:
+		if submit_in_background:
+			doc.ip_address = frappe.local.request_ip
+
 		doc.save()
 		doc._add_attachment(attachments)
 		if not do_not_submit:
-			doc.submit()
+			if submit_in_background:
+				doc.enqueue_submit()
+			else:
+				doc.submit()
 
 	return doc
 
 
-def get_outgoing_mail_for_bulk_insert(**kwargs) -> "OutgoingMail":
+def get_outgoing_mail_for_bulk_insert(
+	defer_message_build: bool = False, **kwargs
+) -> "OutgoingMail":
 	frappe.flags.bulk_insert = True
 
+	attachments = kwargs.pop("attachments", None)
 	doc = create_outgoing_mail(**kwargs, do_not_save=True)
 	mailbox = frappe.get_cached_doc("Mailbox", doc.sender)
 	doc.domain_name = mailbox.domain_name
@@ -902,12 +997,14 @@ def get_outgoing_mail_for_bulk_insert(**kwargs) -> "OutgoingMail":
 	doc.reply_to = doc.reply_to or mailbox.reply_to
 
 	doc.autoname()
+	doc._add_attachment(attachments)
+	doc.flags.defer_message_build = defer_message_build
 	doc.validate()
 
-	for recipient in doc.recipients:
-		recipient.docstatus = 1
-		recipient.parent = doc.name
-		recipient.name = str(uuid7())
+	for child in doc.get_all_children():
+		child.docstatus = 1
+		child.parent = doc.name
+		child.name = str(uuid7())
 
 	doc.docstatus = 1
 	doc.folder = "Sent"
@@ -918,6 +1015,169 @@ def get_outgoing_mail_for_bulk_insert(**kwargs) -> "OutgoingMail":
 	return doc
 
 
+def compile_newsletter_template(template: dict) -> tuple["Template", "Template"]:
+	"""Returns the compiled subject and HTML body of the newsletter template, throws if invalid."""
+
+	from jinja2 import TemplateSyntaxError
+	from jinja2.sandbox import SandboxedEnvironment
+
+	try:
+		subject = SandboxedEnvironment().from_string(template.get("subject") or "")
+		body_html = SandboxedEnvironment(autoescape=True).from_string(
+			template.get("body_html") or ""
+		)
+	except TemplateSyntaxError as e:
+		frappe.throw(_("Invalid newsletter template: {0}").format(e), title=_("Template Error"))
+
+	return subject, body_html
+
+
+def get_outgoing_mails_from_template(
+	template: dict, recipients: list[dict], defer_message_build: bool = False
+) -> list["OutgoingMail"]:
+	"""Returns the outgoing mails for bulk insert, rendering the newsletter template for each recipient.
+
+	The recipients that fail are left out and logged together.
+	"""
+
+	from base64 import b64decode
+	from frappe.utils import strip_html
+
+	# Parse the template and decode the attachments once for all the recipients
+	subject, body_html = compile_newsletter_template(template)
+	attachments = [
+		{"filename": a.get("filename"), "content": b64decode(a["content"])}
+		for a in template.get("attachments") or []
+	]
+
+	documents = []
+	errors = []
+	for recipient in recipients:
+		variables = recipient.get("variables") or {}
+
+		# Attachments are saved as File documents during validation, roll them back on failure
+		frappe.db.savepoint("newsletter_recipient")
+		new_blobs = get_new_blobs()
+
+		try:
+			mail = {
+				**template,
+				"to": recipient["to"],
+				"subject": subject.render(variables),
+				"body_html": body_html.render(variables),
+				"attachments": attachments,
+				"is_newsletter": 1,
+			}
+			documents.append(get_outgoing_mail_for_bulk_insert(defer_message_build, **mail))
+		except Exception as e:
+			frappe.db.rollback(save_point="newsletter_recipient")
+			discard_new_blobs(new_blobs, keep=(doc.message_blob for doc in documents))
+			frappe.clear_messages()
+			errors.append({"to": recipient.get("to"), "error": strip_html(str(e))})
+
+	if errors:
+		frappe.log_error(title="Newsletter Template", message=json.dumps(errors, indent=4))
+
+	return documents
+
+
+def build_messages_in_pool(documents: list["OutgoingMail"]) -> dict[str, str]:
+	"""Builds and signs the deferred messages in the process pool and returns the error of each failed mail."""
+
+	from frappe.utils import strip_html
+	from concurrent.futures.process import BrokenProcessPool
+	from mail.utils.message_builder import (
+		build_message,
+		get_message_builder_pool,
+		shutdown_message_builder_pool,
+	)
+
+	pool = get_message_builder_pool()
+	futures = [pool.submit(build_message, *doc._message_build_args) for doc in documents]
+
+	errors = {}
+	for doc, future in zip(documents, futures):
+		try:
+			doc.set_message(future.result())
+			doc.validate_message()
+			doc.validate_rate_limit()
+		except Exception as e:
+			if isinstance(e, BrokenProcessPool):
+				shutdown_message_builder_pool()
+
+			frappe.clear_messages()
+			errors[doc.name] = strip_html(str(e))
+		finally:
+			doc._message_build_args = None
+			doc.flags.defer_message_build = False
+
+	return errors
+
+
+def create_outgoing_mails_in_bulk(mails: list[dict]) -> list[dict]:
+	"""Creates the outgoing mails in a single bulk insert and returns the result for each mail."""
+
+	from frappe.utils import strip_html
+	from frappe.model.document import bulk_insert
+	from mail.utils.message_builder import get_message_builder_pool
+
+	result = []
+	documents = []
+	# The messages are built and signed in parallel once all the mails are validated
+	defer_message_build = get_message_builder_pool() is not None
+
+	try:
+		for idx, mail in enumerate(mails):
+			savepoint = None
+			if mail.get("attachments") or mail.get("raw_message"):
+				# Attachments are saved as File documents during validation, roll them back on failure
+				savepoint = f"outgoing_mail_{idx}"
+				frappe.db.savepoint(savepoint)
+
+			new_blobs = get_new_blobs()
+			try:
+				doc = get_outgoing_mail_for_bulk_insert(defer_message_build, **mail)
+				documents.append(doc)
+				result.append({"name": doc.name})
+			except Exception as e:
+				if savepoint:
+					frappe.db.rollback(save_point=savepoint)
+
+				# The message is stored before it is validated, e.g. its size
+				discard_new_blobs(new_blobs, keep=(doc.message_blob for doc in documents))
+				frappe.clear_messages()
+				result.append({"error": strip_html(str(e))})
+
+		if defer_message_build and documents:
+			if errors := build_messages_in_pool(documents):
+				for row in result:
+					if error := errors.get(row.get("name")):
+						row.pop("name")
+						row["error"] = error
+
+				delete_blobs(doc.message_blob for doc in documents if doc.name in errors)
+				documents = [doc for doc in documents if doc.name not in errors]
+				delete_attachments("Outgoing Mail", list(errors))
+	finally:
+		frappe.flags.bulk_insert = False
+
+	statuses = {doc.name: doc.status for doc in documents}
+	for row in result:
+		if row.get("name"):
+			row["status"] = statuses[row["name"]]
+
+	if documents:
+		bulk_insert("Outgoing Mail", documents)
+
+		for doc in documents:
+			doc.create_mail_contacts()
+
+		enqueue_job(transfer_mails, queue="long", enqueue_after_commit=True)
+		notify_transfer_daemon()
+
+	return result
+
+
 @frappe.whitelist()
 def delete_outgoing_mails(mailbox: str) -> None:
 	"""Deletes the outgoing mails for the given mailbox."""
@@ -926,7 +1186,14 @@ def delete_outgoing_mails(mailbox: str) -> None:
 		frappe.throw(_("Only System Manager can delete Outgoing Mails."))
 
 	if mailbox:
+		outgoing_mails = frappe.db.get_all(
+			"Outgoing Mail", filters={"sender": mailbox}, pluck="name"
+		)
+		message_blobs = get_message_blobs("Outgoing Mail", {"sender": mailbox})
 		frappe.db.delete("Outgoing Mail", {"sender": mailbox})
+		delete_attachments("Outgoing Mail", outgoing_mails)
+		delete_mail_delivery_events(outgoing_mails)
+		delete_blobs(message_blobs)
 
 
 def delete_newsletters() -> None:
@@ -947,8 +1214,9 @@ def delete_newsletters() -> None:
 
 	for retention_days, mail_domains in newsletter_retention_and_mail_domains_map.items():
 		OM = frappe.qb.DocType("Outgoing Mail")
-		(
+		newsletters = (
 			frappe.qb.from_(OM)
+			.select(OM.name)
 			.where(
 				(OM.docstatus != 0)
 				& (OM.status == "Sent")
@@ -956,8 +1224,15 @@ def delete_newsletters() -> None:
 				& (OM.domain_name.isin(mail_domains))
 				& (OM.submitted_at < (Now() - Interval(days=retention_days)))
 			)
-			.delete()
-		).run()
+		).run(pluck="name")
+
+		for i in range(0, len(newsletters), 1000):
+			names = newsletters[i : i + 1000]
+			message_blobs = get_message_blobs("Outgoing Mail", {"name": ["in", names]})
+			frappe.db.delete("Outgoing Mail", {"name": ["in", names]})
+			delete_attachments("Outgoing Mail", names)
+			delete_mail_delivery_events(names)
+			delete_blobs(message_blobs)
 
 
 def has_permission(doc: "Document", ptype: str, user: str) -> bool:
@@ -991,38 +1266,97 @@ def get_permission_query_condition(user: str | None = None) -> str:
 def transfer_mails() -> None:
 	"""Transfers the mails to RabbitMQ."""
 
-	def get_mails_to_transfer(limit: int) -> list[dict]:
-		"""Returns the mails to transfer."""
-
-		from frappe.query_builder.functions import GroupConcat
+	def get_mails_to_transfer(outgoing_mails: list[str]) -> list[dict]:
+		"""Returns the mails to transfer with their recipients, in the given order."""
 
 		OM = frappe.qb.DocType("Outgoing Mail")
-		MR = frappe.qb.DocType("Mail Recipient")
-		return (
+		mails = (
 			frappe.qb.from_(OM)
-			.join(MR)
-			.on(OM.name == MR.parent)
-			.select(
-				OM.name,
-				OM.is_newsletter,
-				OM.domain_name,
-				OM.message,
-				GroupConcat(MR.email).as_("recipients"),
-			)
-			.where((OM.docstatus == 1) & (OM.status == "Pending"))
-			.groupby(OM.name, OM.is_newsletter, OM.domain_name, OM.message)
-			.orderby(OM.submitted_at)
-			.limit(limit)
+			.select(OM.name, OM.is_newsletter, OM.domain_name, OM.message_blob)
+			.where(OM.name.isin(outgoing_mails))
 		).run(as_dict=True)
 
+		MR = frappe.qb.DocType("Mail Recipient")
+		recipients = (
+			frappe.qb.from_(MR)
+			.select(MR.parent, MR.email)
+			.where((MR.parenttype == "Outgoing Mail") & (MR.parent.isin(outgoing_mails)))
+		).run(as_dict=True)
+
+		recipients_map = {}
+		for recipient in recipients:
+			recipients_map.setdefault(recipient.parent, []).append(recipient.email)
+
+		for mail in mails:
+			mail.recipients = recipients_map.get(mail.name, [])
+
+		order = {name: idx for idx, name in enumerate(outgoing_mails)}
+		return sorted(mails, key=lambda mail: order[mail.name])
+
+	def get_messages_to_publish(
+		mails: list[dict],
+		root_domain_name: str,
+		published_mails: list[str],
+		load_errors: dict[str, str],
+		chunk_size: int = 50,
+	) -> Generator:
+		"""Yields the message to publish and its priority for each mail, loading the messages a chunk at a time.
+
+		The mails yielded are appended to `published_mails`, the ones whose message fails to load are left
+		out and their error is set in `load_errors`.
+		"""
+
+		OM = frappe.qb.DocType("Outgoing Mail")
+
+		for i in range(0, len(mails), chunk_size):
+			chunk = mails[i : i + chunk_size]
+			# Messages stored in the blob store are read from it instead
+			if names := [mail.name for mail in chunk if not mail.message_blob]:
+				messages = dict(
+					(frappe.qb.from_(OM).select(OM.name, OM.message).where(OM.name.isin(names))).run()
+				)
+			else:
+				messages = {}
+
+			for mail in chunk:
+				priority = 1
+				if mail.is_newsletter:
+					priority = 0
+				elif mail.domain_name == root_domain_name:
+					priority = 2
+
+				try:
+					message = load_value(messages.get(mail.name), mail.message_blob)
+				except Exception:
+					load_errors[mail.name] = frappe.get_traceback(with_context=False)
+					continue
+
+				data = {
+					"outgoing_mail": mail.name,
+					"recipients": mail.recipients,
+					"message": message,
+				}
+				published_mails.append(mail.name)
+				yield json.dumps(data), priority
+
 	def update_outgoing_mails(
-		outgoing_mails: list, current_status: str, commit: bool = False, **kwargs
+		outgoing_mails: list,
+		current_status: str,
+		claimed_at: str,
+		commit: bool = False,
+		**kwargs,
 	) -> None:
-		"""Updates the outgoing mails."""
+		"""Updates the outgoing mails still claimed by this run, the lease may have been recovered."""
+
+		if not outgoing_mails:
+			return
 
 		OM = frappe.qb.DocType("Outgoing Mail")
 		query = frappe.qb.update(OM).where(
-			(OM.docstatus == 1) & (OM.status == current_status) & (OM.name.isin(outgoing_mails))
+			(OM.docstatus == 1)
+			& (OM.status == current_status)
+			& (OM.transfer_started_at == claimed_at)
+			& (OM.name.isin(outgoing_mails))
 		)
 
 		for field, value in kwargs.items():
@@ -1033,7 +1367,6 @@ def transfer_mails() -> None:
 		if commit:
 			frappe.db.commit()
 
-	import time
 	from mail.utils.cache import get_root_domain_name
 
 	max_failures = 3
@@ -1043,73 +1376,85 @@ def transfer_mails() -> None:
 	)
 	root_domain_name = get_root_domain_name()
 
+	recover_expired_transfers()
+
 	while total_failures < max_failures:
-		current_status = "Pending"
-		mails = get_mails_to_transfer(limit=max_batch_size)
+		pending_mails, claimed_at = claim_mails_to_transfer(max_batch_size)
 
-		if not mails:
+		if not pending_mails:
 			break
 
-		outgoing_mails = [mail["name"] for mail in mails]
-
-		frappe.db.sql(
-			"""
-			UPDATE `tabOutgoing Mail`
-			SET
-				status = %s,
-				error_log = NULL,
-				transfer_started_at = %s,
-				transfer_started_after = TIMESTAMPDIFF(SECOND, `submitted_at`, `transfer_started_at`)
-			WHERE
-				docstatus = 1 AND
-				status = %s AND
-				name IN %s
-			""",
-			("Transferring", now(), current_status, tuple(outgoing_mails)),
-		)
-		frappe.db.commit()
+		outgoing_mails = [mail.name for mail in pending_mails]
 		current_status = "Transferring"
+		published_mails, load_errors, transferred_mails = [], {}, []
 
 		try:
+			mails = get_mails_to_transfer(outgoing_mails)
+
 			with rabbitmq_context() as rmq:
 				rmq.declare_queue(constants.OUTGOING_MAIL_QUEUE, max_priority=3)
+				acked = rmq.publish_many(
+					constants.OUTGOING_MAIL_QUEUE,
+					get_messages_to_publish(mails, root_domain_name, published_mails, load_errors),
+				)
 
-				for mail in mails:
-					priority = 1
-					if mail.is_newsletter:
-						priority = 0
-					elif mail.domain_name == root_domain_name:
-						priority = 2
-
-					data = {
-						"outgoing_mail": mail["name"],
-						"recipients": mail["recipients"].split(","),
-						"message": mail["message"],
-					}
-					rmq.publish(constants.OUTGOING_MAIL_QUEUE, json.dumps(data), priority=priority)
-
-			frappe.db.sql(
-				"""
-				UPDATE `tabOutgoing Mail`
-				SET
-					status = %s,
-					error_log = NULL,
-					transfer_completed_at = %s,
-					transfer_completed_after = TIMESTAMPDIFF(SECOND, `transfer_started_at`, `transfer_completed_at`)
-				WHERE
-					docstatus = 1 AND
-					status = %s AND
-					name IN %s
-				""",
-				("Transferred", now(), current_status, tuple(outgoing_mails)),
-			)
+			# Only the mails confirmed by the broker are transferred, the ones not published are not
+			transferred_mails = [name for name, is_acked in zip(published_mails, acked) if is_acked]
+			unconfirmed_mails = list(set(outgoing_mails) - set(transferred_mails) - set(load_errors))
+
+			if transferred_mails:
+				frappe.db.sql(
+					"""
+					UPDATE `tabOutgoing Mail`
+					SET
+						status = %s,
+						error_log = NULL,
+						transfer_completed_at = %s,
+						transfer_completed_after = TIMESTAMPDIFF(SECOND, `transfer_started_at`, `transfer_completed_at`)
+					WHERE
+						docstatus = 1 AND
+						status = %s AND
+						transfer_started_at = %s AND
+						name IN %s
+					""",
+					("Transferred", now(), current_status, claimed_at, tuple(transferred_mails)),
+				)
+
+			if unconfirmed_mails:
+				total_failures += 1
+				update_outgoing_mails(
+					unconfirmed_mails,
+					current_status=current_status,
+					claimed_at=claimed_at,
+					status="Failed",
+					error_log=_("The mail was not confirmed by RabbitMQ."),
+				)
+
+			if load_errors:
+				total_failures += 1
+
+			for name, error_log in load_errors.items():
+				update_outgoing_mails(
+					[name],
+					current_status=current_status,
+					claimed_at=claimed_at,
+					status="Failed",
+					error_log=error_log,
+				)
+
+			frappe.db.commit()
 			current_status = "Transferred"
 		except Exception:
 			total_failures += 1
 			error_log = frappe.get_traceback(with_context=False)
 			frappe.log_error(title="Transfer Mails", message=error_log)
+			# The mails confirmed by the broker are not failed, a retry would send them twice
 			update_outgoing_mails(
-				outgoing_mails, current_status=current_status, status="Failed", error_log=error_log
+				list(set(outgoing_mails) - set(transferred_mails)),
+				current_status=current_status,
+				claimed_at=claimed_at,
+				status="Failed",
+				error_log=error_log,
 			)
 			current_status = "Failed"
 
@@ -1117,8 +1462,272 @@ def transfer_mails() -> None:
 				time.sleep(5)
 
 
-def get_outgoing_mails_status() -> None:
-	"""Gets the outgoing mails status from RabbitMQ."""
+def get_pending_mails_query(
+	limit: int, domain_name: str | None = None, after: tuple[str, str] | None = None
+) -> "QueryBuilder":
+	"""Returns the query of the names of the mails pending transfer, in the order they were submitted.
+
+	It is resolved from the `(docstatus, status, domain_name, submitted_at, name)` index alone, or the
+	`(docstatus, status, submitted_at, name)` one for all the domains. `after` is the `(submitted_at, name)`
+	of the last mail already selected.
+	"""
+
+	OM = frappe.qb.DocType("Outgoing Mail")
+	query = (
+		frappe.qb.from_(OM)
+		.select(OM.name, OM.submitted_at)
+		.where((OM.docstatus == 1) & (OM.status == "Pending"))
+		.orderby(OM.submitted_at)
+		.orderby(OM.name)
+		.limit(limit)
+	)
+
+	if domain_name:
+		query = query.where(OM.domain_name == domain_name)
+
+	if after:
+		submitted_at, name = after
+		query = query.where(
+			(OM.submitted_at > submitted_at)
+			| ((OM.submitted_at == submitted_at) & (OM.name > name))
+		)
+
+	return query
+
+
+def get_pending_domains_query() -> "QueryBuilder":
+	"""Returns the query of the domains with mails pending transfer, resolved from the domain index alone."""
+
+	OM = frappe.qb.DocType("Outgoing Mail")
+	return (
+		frappe.qb.from_(OM)
+		.select(OM.domain_name)
+		.distinct()
+		.where((OM.docstatus == 1) & (OM.status == "Pending"))
+	)
+
+
+def select_fair_batch(limit: int) -> list[dict]:
+	"""Selects and locks a batch of the pending mails, shared between the domains by deficit round-robin.
+
+	Each round, a domain earns a quantum proportional to its transfer weight and takes as many mails as its
+	deficit allows, the fraction left is carried over to the next batch. A domain without pending mails
+	loses its deficit. The batch is ordered so that the domains are interleaved by weight.
+
+	The deficits and the starting domain are kept in Redis, shared by the jobs and the workers of the site.
+	Concurrent batches read the same deficits and the last one to finish writes them.
+	"""
+
+	if not (pending_domains := get_pending_domains_query().run(pluck="domain_name")):
+		return []
+
+	weights = dict(
+		frappe.db.get_all(
+			"Mail Domain",
+			filters={"name": ["in", pending_domains]},
+			fields=["name", "transfer_weight"],
+			as_list=True,
+		)
+	)
+	weights = {domain: max(cint(weights.get(domain)), 1) for domain in pending_domains}
+	quantum = limit / sum(weights.values())
+
+	deficits_key = frappe.cache.make_key(constants.TRANSFER_DEFICITS_KEY)
+	stored_deficits = {
+		domain.decode(): flt(deficit)
+		for domain, deficit in frappe.cache.hgetall(deficits_key).items()
+	}
+	deficits = {domain: stored_deficits.get(domain, 0) for domain in pending_domains}
+
+	# The round starts from the next domain each batch, so that no domain is always served last
+	offset = frappe.cache.incr(frappe.cache.make_key(constants.TRANSFER_OFFSET_KEY))
+	offset %= len(pending_domains)
+	active_domains = pending_domains[offset:] + pending_domains[:offset]
+
+	selected = {domain: [] for domain in pending_domains}
+	remaining = limit
+	rounds = 0
+
+	# The rounds that query the domains are capped, each one runs a locking query per domain served
+	while remaining and active_domains and rounds < constants.TRANSFER_MAX_ROUNDS:
+		served = False
+		for domain in list(active_domains):
+			deficits[domain] += quantum * weights[domain]
+			count = min(int(deficits[domain]), remaining)
+
+			if count < 1:
+				continue
+
+			served = True
+			after = None
+			if selected[domain]:
+				# The rows locked by this transaction are not skipped, they are excluded by keyset
+				after = (selected[domain][-1].submitted_at, selected[domain][-1].name)
+			mails = (
+				get_pending_mails_query(count, domain_name=domain, after=after)
+				.for_update(skip_locked=True)
+				.run(as_dict=True)
+			)
+			selected[domain].extend(mails)
+			deficits[domain] -= len(mails)
+			remaining -= len(mails)
+
+			if len(mails) < count:
+				active_domains.remove(domain)
+				deficits[domain] = 0
+
+			if not remaining:
+				break
+
+		rounds += served
+
+	pipeline = frappe.cache.pipeline()
+	pipeline.delete(deficits_key)
+	if deficits := {domain: deficit for domain, deficit in deficits.items() if deficit}:
+		pipeline.hset(deficits_key, mapping=deficits)
+	pipeline.execute()
+
+	batch = []
+	for domain, mails in selected.items():
+		for idx, mail in enumerate(mails):
+			# The virtual finish time of weighted fair queueing, e.g. a domain with twice the weight is
+			# interleaved twice as often
+			batch.append(((idx + 1) / weights[domain], mail))
+
+	return [mail for __, mail in sorted(batch, key=lambda item: item[0])]
+
+
+def notify_transfer_daemon() -> None:
+	"""Wakes up the transfer daemon once the transaction is committed."""
+
+	def _notify() -> None:
+		key = frappe.cache.make_key(constants.TRANSFER_NOTIFICATION_KEY)
+
+		# A single notification is kept, the daemon transfers all the pending mails when woken up
+		pipeline = frappe.cache.pipeline()
+		pipeline.rpush(key, 1)
+		pipeline.ltrim(key, -1, -1)
+		pipeline.execute()
+
+	frappe.db.after_commit.add(_notify)
+
+
+def run_transfer_daemon(poll_interval: int = 5) -> None:
+	"""Transfers the mails as soon as they are submitted, until the process is stopped.
+
+	Between runs it waits for a notification from `notify_transfer_daemon`, at most `poll_interval` seconds.
+	"""
+
+	import signal
+
+	stopped = False
+
+	def stop(signum, frame) -> None:
+		nonlocal stopped
+		stopped = True
+
+	# The current batch is transferred completely before stopping
+	signal.signal(signal.SIGTERM, stop)
+	signal.signal(signal.SIGINT, stop)
+
+	frappe.session.user = get_postmaster()
+	key = frappe.cache.make_key(constants.TRANSFER_NOTIFICATION_KEY)
+
+	while not stopped:
+		reset_local_caches()
+
+		try:
+			transfer_mails()
+			frappe.db.commit()
+		except Exception:
+			# The claimed mails are recovered once their lease expires if the connection was lost
+			if rollback_or_reconnect():
+				frappe.log_error(title="Transfer Daemon")
+				frappe.db.commit()
+
+		if stopped:
+			break
+
+		# Notifications sent during the run are consumed here and their mails transferred by the next run
+		frappe.cache.blpop(key, timeout=poll_interval)
+		frappe.cache.delete(key)
+
+
+def claim_mails_to_transfer(limit: int) -> tuple[list[dict], str | None]:
+	"""Claims a batch of the mails pending transfer and returns it with the time it was claimed at.
+
+	The rows locked by other workers are skipped, so that concurrent workers claim disjoint batches. The
+	claim is a lease on `transfer_started_at`, the mails are pending again once it expires.
+	"""
+
+	# The batch is selected from the index only, the messages are read for the claimed mails after
+	pending_mails = select_fair_batch(limit)
+
+	if not pending_mails:
+		return [], None
+
+	claimed_at = now()
+	frappe.db.sql(
+		"""
+		UPDATE `tabOutgoing Mail`
+		SET
+			status = %s,
+			error_log = NULL,
+			transfer_started_at = %s,
+			transfer_started_after = TIMESTAMPDIFF(SECOND, `submitted_at`, `transfer_started_at`)
+		WHERE
+			docstatus = 1 AND
+			status = %s AND
+			name IN %s
+		""",
+		("Transferring", claimed_at, "Pending", tuple(mail.name for mail in pending_mails)),
+	)
+	frappe.db.commit()
+
+	return pending_mails, claimed_at
+
+
+def recover_expired_transfers() -> None:
+	"""Sets the mails whose transfer lease has expired, e.g. as their worker died, back to pending."""
+
+	lease_duration = (
+		frappe.db.get_single_value("Mail Settings", "transfer_lease_duration", cache=True) or 600
+	)
+	# Computed like `claimed_at`, in the system timezone, which the database one may not match
+	expires_before = add_to_date(now(), seconds=-lease_duration)
+
+	OM = frappe.qb.DocType("Outgoing Mail")
+	(
+		frappe.qb.update(OM)
+		.set(OM.status, "Pending")
+		.set(OM.transfer_started_at, None)
+		.set(OM.transfer_started_after, None)
+		.where(
+			(OM.docstatus == 1)
+			& (OM.status == "Transferring")
+			& (OM.transfer_started_at < expires_before)
+		)
+	).run()
+	frappe.db.commit()
+
+
+def get_status_from_recipients(statuses: list[str]) -> str:
+	"""Returns the status of an Outgoing Mail based on the status of its recipients."""
+
+	sent_count = statuses.count("Sent")
+
+	if sent_count == len(statuses):
+		return "Sent"
+	elif sent_count > 0:
+		return "Partially Sent"
+	elif statuses.count("Deferred") == len(statuses):
+		return "Deferred"
+
+	return "Bounced"
+
+
+def get_outgoing_mails_status(batch_size: int = 1000) -> None:
+	"""Gets the outgoing mails status from RabbitMQ and applies them in batches."""
 
 	def has_unsynced_outgoing_mails() -> bool:
 		"""Returns True if there are unsynced outgoing mails."""
@@ -1134,87 +1743,221 @@ def get_outgoing_mails_status() -> None:
 
 		return bool(mails)
 
-	def queue_ok(agent: str, data: dict) -> None:
-		"""Updates Queue ID in Outgoing Mail."""
+	if not has_unsynced_outgoing_mails():
+		return
+
+	try:
+		with rabbitmq_context() as rmq:
+			rmq.declare_queue(constants.OUTGOING_MAIL_STATUS_QUEUE, max_priority=3)
+
+			while True:
+				statuses = []
+				delivery_tag = None
+
+				for __ in range(batch_size):
+					result = rmq.basic_get(constants.OUTGOING_MAIL_STATUS_QUEUE)
+
+					if not result:
+						break
+
+					method, properties, body = result
+					delivery_tag = method.delivery_tag
+
+					if body:
+						statuses.append((properties.app_id, json.loads(body)))
+
+				if delivery_tag is None:
+					break
+
+				apply_outgoing_mails_status(statuses)
+				frappe.db.commit()
+				# Acknowledges all the messages of the batch at once, they are redelivered if not committed
+				rmq.channel.basic_ack(delivery_tag=delivery_tag, multiple=True)
 
-		frappe.db.set_value(
-			"Outgoing Mail",
-			data["outgoing_mail"],
-			{"status": "Queued", "agent": agent, "queue_id": data["queue_id"]},
+				if not result:
+					break
+	except Exception:
+		frappe.db.rollback()
+		frappe.log_error(
+			title="Get Outgoing Mails Status",
+			message=frappe.get_traceback(with_context=False),
 		)
 
-	def undelivered(data: dict) -> None:
-		"""Updates Outgoing Mail status to Deferred or Bounced."""
+
+class OutgoingMailStatusConsumer(RabbitMQConsumer):
+	"""Applies the status messages in batches as soon as they are pushed by RabbitMQ.
+
+	A batch is applied once it has `batch_size` messages or its first message waited `max_wait` seconds.
+	"""
+
+	queue = constants.OUTGOING_MAIL_STATUS_QUEUE
+	max_priority = 3
+	batch_size = 500
+	max_wait = 1
+	# Enough unacknowledged messages are delivered to fill a batch
+	prefetch_count = 2 * batch_size
+
+	def on_connect(self) -> None:
+		self.statuses = []
+		self.message_count = 0
+		self.delivery_tag = None
+		self.first_received_at = None
+
+	def on_message(
+		self, channel: "BlockingChannel", method: Any, properties: Any, body: bytes
+	) -> None:
+		if body:
+			self.statuses.append((properties.app_id, json.loads(body)))
+
+		self.message_count += 1
+		self.delivery_tag = method.delivery_tag
+		self.first_received_at = self.first_received_at or time.monotonic()
+
+		if self.message_count >= self.batch_size:
+			self.apply_batch()
+
+	def on_tick(self) -> None:
+		if self.message_count and (
+			self.stopped or time.monotonic() - self.first_received_at >= self.max_wait
+		):
+			self.apply_batch()
+
+	def apply_batch(self) -> None:
+		"""Applies the status messages received so far and acknowledges them at once."""
+
+		statuses, delivery_tag = self.statuses, self.delivery_tag
+		self.on_connect()
 
 		try:
-			outgoing_mail = data.get("outgoing_mail")
-			queue_id = data["queue_id"]
-			hook = data["hook"]
-			rcpt_to = data["rcpt_to"]
-			retries = data["retries"]
-			action_at = parse_iso_datetime(data["action_at"])
-
-			if not outgoing_mail:
-				outgoing_mail = frappe.db.exists("Outgoing Mail", {"queue_id": queue_id})
-
-				if not outgoing_mail:
-					frappe.log_error(title="Outgoing Mail Not Found", message=str(data))
-					return
-
-			doc = frappe.get_doc("Outgoing Mail", outgoing_mail, for_update=True)
-			recipients = {
-				parseaddr(recipient["original"])[1]: recipient for recipient in rcpt_to
-			}
-			status = "Deferred" if hook == "deferred" else "Bounced"
-
-			for recipient in doc.recipients:
-				if recipient.email in recipients:
-					recipient.status = status
-					recipient.retries = retries
-					recipient.action_at = action_at
-					recipient.action_after = time_diff_in_seconds(
-						recipient.action_at, doc.transfer_completed_at
+			apply_outgoing_mails_status(statuses)
+		except Exception:
+			if not self.handle_error():
+				return
+
+			# A failing status must not hold back the others, they are applied one by one
+			for status in statuses:
+				frappe.db.savepoint("apply_status")
+				try:
+					apply_outgoing_mails_status([status])
+				except Exception:
+					frappe.db.rollback(save_point="apply_status")
+					frappe.log_error(
+						title="Apply Outgoing Mail Status",
+						message=f"{frappe.get_traceback(with_context=False)}\n\n{status[1]}",
 					)
-					recipient.details = json.dumps(recipients[recipient.email], indent=4)
-					recipient.db_update()
 
-			doc.update_status(db_set=False)
-			doc.db_update()
+		frappe.db.commit()
+		self.channel.basic_ack(delivery_tag=delivery_tag, multiple=True)
+
 
-		except Exception:
-			frappe.log_error(
-				title="Error Updating Outgoing Mail Status", message=frappe.get_traceback()
+def run_outgoing_mail_status_consumer() -> None:
+	"""Consumes the outgoing mails status queue until the process is stopped."""
+
+	frappe.session.user = get_postmaster()
+	OutgoingMailStatusConsumer().run()
+
+
+def apply_outgoing_mails_status(statuses: list[tuple[str | None, dict]]) -> None:
+	"""Applies the status messages, `(agent, data)`, to the Outgoing Mails and their recipients."""
+
+	OM = frappe.qb.DocType("Outgoing Mail")
+	MR = frappe.qb.DocType("Mail Recipient")
+
+	queued_mails = {
+		data["queue_id"]: data["outgoing_mail"]
+		for __, data in statuses
+		if data["hook"] == "queue_ok"
+	}
+	mail_by_queue_id = dict(queued_mails)
+
+	# Mails referenced by their Queue ID only are looked up in the cache first, then in the database
+	if queue_ids := {
+		data["queue_id"]
+		for __, data in statuses
+		if not data.get("outgoing_mail") and data["queue_id"] not in mail_by_queue_id
+	}:
+		mail_by_queue_id.update(get_outgoing_mails_by_queue_id(list(queue_ids)))
+
+		if queue_ids := queue_ids - set(mail_by_queue_id):
+			found_mails = dict(
+				(
+					frappe.qb.from_(OM)
+					.select(OM.queue_id, OM.name)
+					.where(OM.queue_id.isin(list(queue_ids)))
+				).run()
 			)
+			mail_by_queue_id.update(found_mails)
+			queued_mails.update(found_mails)
 
-	def delivered(data: dict) -> None:
-		"""Updates Outgoing Mail status to Sent or Partially Sent."""
+	if queued_mails:
+		# Cached once committed, a rolled back batch is redelivered and cached again
+		frappe.db.after_commit.add(lambda: set_outgoing_mails_by_queue_id(queued_mails))
 
-		try:
-			outgoing_mail = data.get("outgoing_mail")
-			queue_id = data["queue_id"]
-			retries = data["retries"]
-			action_at = parse_iso_datetime(data["action_at"])
-			host, ip, response, delay, port, mode, ok_recips, secured, verified = data["params"]
-
-			if not outgoing_mail:
-				outgoing_mail = frappe.db.exists("Outgoing Mail", {"queue_id": queue_id})
-
-				if not outgoing_mail:
-					frappe.log_error(title="Outgoing Mail Not Found", message=str(data))
-					return
-
-			doc = frappe.get_doc("Outgoing Mail", outgoing_mail, for_update=True)
-			recipients = [parseaddr(recipient["original"])[1] for recipient in ok_recips]
-
-			for recipient in doc.recipients:
-				if recipient.email in recipients:
-					recipient.status = "Sent"
-					recipient.retries = retries
-					recipient.action_at = action_at
-					recipient.action_after = time_diff_in_seconds(
-						recipient.action_at, doc.transfer_completed_at
+	statuses_by_mail = {}
+	for agent, data in statuses:
+		if outgoing_mail := data.get("outgoing_mail") or mail_by_queue_id.get(data["queue_id"]):
+			statuses_by_mail.setdefault(outgoing_mail, []).append((agent, data))
+		else:
+			frappe.log_error(title="Outgoing Mail Not Found", message=str(data))
+
+	if not statuses_by_mail:
+		return
+
+	mails = {
+		mail.name: mail
+		for mail in (
+			frappe.qb.from_(OM)
+			.select(OM.name, OM.via_api, OM.transfer_completed_at)
+			.where(OM.name.isin(list(statuses_by_mail)))
+			.for_update()
+		).run(as_dict=True)
+	}
+	recipients_by_mail = {}
+	for recipient in (
+		frappe.qb.from_(MR)
+		.select(MR.name, MR.parent, MR.email, MR.status)
+		.where((MR.parenttype == "Outgoing Mail") & (MR.parent.isin(list(mails))))
+		.orderby(MR.idx)
+	).run(as_dict=True):
+		recipients_by_mail.setdefault(recipient.parent, []).append(recipient)
+
+	mail_updates = {}
+	recipient_updates = {}
+	delivery_events = []
+
+	for outgoing_mail, mail_statuses in statuses_by_mail.items():
+		if not (mail := mails.get(outgoing_mail)):
+			for __, data in mail_statuses:
+				frappe.log_error(title="Outgoing Mail Not Found", message=str(data))
+			continue
+
+		recipients = recipients_by_mail.get(outgoing_mail, [])
+
+		# The messages of a mail are applied in the order they were published
+		for agent, data in mail_statuses:
+			try:
+				hook = data["hook"]
+
+				if hook == "queue_ok":
+					mail_updates.setdefault(outgoing_mail, {}).update(
+						{"status": "Queued", "agent": agent, "queue_id": data["queue_id"]}
 					)
-					recipient.details = json.dumps(
+					continue
+
+				retries = data["retries"]
+				action_at = parse_iso_datetime(data["action_at"])
+				action_after = time_diff_in_seconds(action_at, mail.transfer_completed_at)
+
+				if hook in ["bounce", "deferred"]:
+					status = "Deferred" if hook == "deferred" else "Bounced"
+					details = {
+						parseaddr(recipient["original"])[1]: json.dumps(recipient, separators=(",", ":"))
+						for recipient in data["rcpt_to"]
+					}
+				elif hook == "delivered":
+					host, ip, response, delay, port, mode, ok_recips, secured, verified = data["params"]
+					status = "Sent"
+					delivery_details = json.dumps(
 						{
 							"host": host,
 							"ip": ip,
@@ -1225,49 +1968,60 @@ def get_outgoing_mails_status() -> None:
 							"secured": secured,
 							"verified": verified,
 						},
-						indent=4,
+						separators=(",", ":"),
 					)
-					recipient.db_update()
-
-				doc.update_status(db_set=False)
-				doc.db_update()
-
-		except Exception:
-			frappe.log_error(
-				title="Error Updating Outgoing Mail Status", message=frappe.get_traceback()
-			)
-
-	if not has_unsynced_outgoing_mails():
-		return
-
-	try:
-		with rabbitmq_context() as rmq:
-			rmq.declare_queue(constants.OUTGOING_MAIL_STATUS_QUEUE, max_priority=3)
-
-			while True:
-				result = rmq.basic_get(constants.OUTGOING_MAIL_STATUS_QUEUE)
+					details = {
+						parseaddr(recipient["original"])[1]: delivery_details for recipient in ok_recips
+					}
+				else:
+					continue
+
+				for recipient in recipients:
+					if recipient.email in details:
+						recipient.status = status
+						# Only the current status is kept on the recipient, every event is appended to the log
+						recipient_updates[recipient.name] = {
+							"status": status,
+							"retries": retries,
+							"action_at": action_at,
+							"action_after": action_after,
+						}
+						delivery_events.append(
+							{
+								"outgoing_mail": outgoing_mail,
+								"recipient": recipient.email,
+								"status": status,
+								"retries": retries,
+								"action_at": action_at,
+								"details": details[recipient.email],
+							}
+						)
 
-				if result:
-					method, properties, body = result
-					if body:
-						data = json.loads(body)
-						hook = data["hook"]
+				mail_updates.setdefault(outgoing_mail, {})["status"] = get_status_from_recipients(
+					[recipient.status for recipient in recipients]
+				)
 
-						if hook == "queue_ok":
-							queue_ok(properties.app_id, data)
-						elif hook in ["bounce", "deferred"]:
-							undelivered(data)
-						elif hook == "delivered":
-							delivered(data)
+			except Exception:
+				frappe.log_error(
+					title="Error Updating Outgoing Mail Status", message=frappe.get_traceback()
+				)
 
-					rmq.channel.basic_ack(delivery_tag=method.delivery_tag)
-				else:
-					break
-	except Exception:
-		frappe.log_error(
-			title="Get Outgoing Mails Status",
-			message=frappe.get_traceback(with_context=False),
-		)
+	bulk_update("Mail Recipient", recipient_updates)
+	bulk_update("Outgoing Mail", mail_updates)
+	insert_mail_delivery_events(delivery_events)
+
+	if sent_via_api := [
+		outgoing_mail
+		for outgoing_mail, updates in mail_updates.items()
+		if updates["status"] == "Sent" and mails[outgoing_mail].via_api
+	]:
+		# Only the fields of the notifications are read, not the whole documents
+		for mail in (
+			frappe.qb.from_(OM)
+			.select(OM.name, OM.sender, OM.folder, OM.subject, OM.body_plain)
+			.where(OM.name.isin(sent_via_api))
+		).run(as_dict=True):
+			notify_mail_event("outgoing_mail_sent", mail.sender, "Outgoing Mail", mail)
 
 
 def process_newsletter_queue(batch_size: int = 1000) -> None:
@@ -1275,50 +2029,113 @@ def process_newsletter_queue(batch_size: int = 1000) -> None:
 
 	from frappe.model.document import bulk_insert
 
+	from mail.utils.message_builder import (
+		get_message_builder_pool,
+		shutdown_message_builder_pool,
+	)
+
 	batch_size = min(batch_size, 1000)
+	# The messages of a batch are built and signed in parallel before the bulk insert
+	defer_message_build = get_message_builder_pool() is not None
 
-	while True:
-		documents = []
-		delivery_tags = []
+	try:
+		while True:
+			documents = []
+			delivery_tags = []
 
-		with rabbitmq_context() as rmq:
-			rmq.declare_queue(constants.NEWSLETTER_QUEUE)
+			with rabbitmq_context() as rmq:
+				rmq.declare_queue(constants.NEWSLETTER_QUEUE)
 
-			for x in range(batch_size):
-				result = rmq.basic_get(constants.NEWSLETTER_QUEUE)
+				while len(documents) < batch_size:
+					result = rmq.basic_get(constants.NEWSLETTER_QUEUE)
 
-				if not result:
-					break
+					if not result:
+						break
+
+					method, properties, body = result
+
+					try:
+						mail = json.loads(body) if body else None
+					except Exception:
+						mail = None
+						frappe.log_error(
+							title="Process Newsletter Queue", message=frappe.get_traceback()
+						)
+
+					# A template expands to a mail per recipient, left for the next batch if it does not fit
+					size = len(mail.get("recipients") or []) if mail and "template" in mail else 1
+					if documents and len(documents) + size > batch_size:
+						rmq.channel.basic_reject(delivery_tag=method.delivery_tag, requeue=True)
+						break
 
-				method, properties, body = result
-				if body:
-					mail = json.loads(body)
-					mail["is_newsletter"] = 1
-					doc = get_outgoing_mail_for_bulk_insert(**mail)
-					documents.append(doc)
+					# Acknowledged with the batch even if it fails, it would fail again on every run
 					delivery_tags.append(method.delivery_tag)
 
-			if not documents:
-				break
+					if not mail:
+						continue
 
-			try:
-				bulk_insert("Outgoing Mail", documents)
-				frappe.db.commit()
+					try:
+						if "template" in mail:
+							documents.extend(
+								get_outgoing_mails_from_template(
+									mail["template"], mail["recipients"], defer_message_build
+								)
+							)
+						else:
+							mail["is_newsletter"] = 1
+							doc = get_outgoing_mail_for_bulk_insert(defer_message_build, **mail)
+							documents.append(doc)
+					except Exception:
+						frappe.log_error(
+							title="Process Newsletter Queue", message=frappe.get_traceback()
+						)
 
-				if delivery_tags:
+				if not delivery_tags:
+					break
+
+				try:
+					if defer_message_build and (errors := build_messages_in_pool(documents)):
+						frappe.log_error(
+							title="Process Newsletter Queue", message=json.dumps(errors, indent=4)
+						)
+						delete_blobs(doc.message_blob for doc in documents if doc.name in errors)
+						documents = [doc for doc in documents if doc.name not in errors]
+						delete_attachments("Outgoing Mail", list(errors))
+
+					if documents:
+						bulk_insert("Outgoing Mail", documents)
+						notify_transfer_daemon()
+					frappe.db.commit()
 					rmq.channel.basic_ack(delivery_tag=delivery_tags[-1], multiple=True)
-			except Exception:
-				if delivery_tags:
-					rmq.channel.basic_nack(delivery_tag=delivery_tags[-1], multiple=True, requeue=True)
+				except Exception:
+					rmq.channel.basic_nack(
+						delivery_tag=delivery_tags[-1], multiple=True, requeue=True
+					)
 
-				frappe.log_error(title="Process Newsletter Queue", message=frappe.get_traceback())
+					frappe.log_error(
+						title="Process Newsletter Queue", message=frappe.get_traceback()
+					)
+	finally:
+		# The job runs in a work horse of its own, the builder processes would be left behind
+		shutdown_message_builder_pool()
 
 
 def enqueue_transfer_mails() -> None:
-	"Called by the scheduler to enqueue the `transfer_mails` job."
+	"Called by the scheduler to enqueue the `transfer_mails` jobs, one per transfer worker."
 
 	frappe.session.user = get_postmaster()
-	enqueue_job(transfer_mails, queue="long")
+	transfer_workers = (
+		frappe.db.get_single_value("Mail Settings", "transfer_workers", cache=True) or 1
+	)
+
+	# The workers claim disjoint batches, each job is only enqueued if it is not queued or running yet
+	for worker in range(transfer_workers):
+		frappe.enqueue(
+			transfer_mails,
+			queue="long",
+			job_id=f"transfer_mails::{worker}",
+			deduplicate=True,
+		)
 
 
 @frappe.whitelist()
@@ -1333,3 +2150,16 @@ def enqueue_process_newsletter_queue() -> None:
 	"Called by the scheduler to enqueue the `process_newsletter_queue` job."
 
 	enqueue_job(process_newsletter_queue, queue="long")
+
+
+def on_doctype_update():
+	frappe.db.add_index(
+		"Outgoing Mail",
+		["docstatus", "status", "submitted_at", "name"],
+		index_name="docstatus_status_submitted_at_name_index",
+	)
+	frappe.db.add_index(
+		"Outgoing Mail",
+		["docstatus", "status", "domain_name", "submitted_at", "name"],
+		index_name="docstatus_status_domain_name_submitted_at_name_index",
+	)
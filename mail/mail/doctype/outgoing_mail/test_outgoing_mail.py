@@ -1,9 +1,35 @@
 # Copyright (c) 2024, Frappe Technologies Pvt. Ltd. and Contributors
 # See license.txt
 
-# import frappe
+import frappe
+from frappe.utils import now
 from frappe.tests.utils import FrappeTestCase
+from mail.mail.doctype.outgoing_mail.outgoing_mail import (
+	get_pending_mails_query,
+	get_pending_domains_query,
+)
 
 
 class TestOutgoingMail(FrappeTestCase):
-	pass
+	def test_pending_mails_query_plan(self) -> None:
+		if frappe.db.db_type != "mariadb":
+			self.skipTest("The query plan is only checked on MariaDB")
+
+		queries = [
+			(get_pending_mails_query(1000), "docstatus_status_submitted_at_name_index"),
+			(
+				get_pending_mails_query(1000, domain_name="example.com", after=(now(), "")),
+				"docstatus_status_domain_name_submitted_at_name_index",
+			),
+			(get_pending_domains_query(), "docstatus_status_domain_name_submitted_at_name_index"),
+		]
+
+		for query, index in queries:
+			plan = frappe.db.sql(f"EXPLAIN {query.get_sql()}", as_dict=True)
+
+			# A single read of the covering index, without temporary tables or sorting
+			self.assertEqual(len(plan), 1)
+			self.assertEqual(plan[0].key, index)
+			self.assertIn("Using index", plan[0].Extra)
+			self.assertNotIn("Using temporary", plan[0].Extra)
+			self.assertNotIn("Using filesort", plan[0].Extra)
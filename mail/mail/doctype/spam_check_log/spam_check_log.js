@@ -1,8 +1,8 @@
 // Copyright (c) 2024, Frappe Technologies Pvt. Ltd. and contributors
 // For license information, please see license.txt
 
-// frappe.ui.form.on("Spam Check Log", {
-// 	refresh(frm) {
-
-// 	},
-// });
+frappe.ui.form.on("Spam Check Log", {
+	refresh(frm) {
+        mail.render_compressed_fields(frm);
+	},
+});
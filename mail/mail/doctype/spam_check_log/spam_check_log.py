@@ -10,17 +10,23 @@ from email import message_from_string
 from mail.utils import get_host_by_ip
 from frappe.query_builder import Interval
 from frappe.model.document import Document
+from mail.utils.compression import CompressedField, set_decompressed_onload
 from email.mime.multipart import MIMEMultipart
 from frappe.query_builder.functions import Now
 from frappe.utils import now, time_diff_in_seconds
 
 
 class SpamCheckLog(Document):
+	message = CompressedField()
+
 	@staticmethod
 	def clear_old_logs(days=14):
 		log = frappe.qb.DocType("Spam Check Log")
 		frappe.db.delete(log, filters=(log.creation < (Now() - Interval(days=days))))
 
+	def onload(self) -> None:
+		set_decompressed_onload(self)
+
 	def validate(self) -> None:
 		if self.is_new():
 			self.set_source_ip_address()
@@ -51,10 +57,11 @@ class SpamCheckLog(Document):
 		hybrid_scanning_threshold = mail_settings.hybrid_scanning_threshold
 
 		response = None
+		message = self.flags.raw_message or self.message
 		self.started_at = now()
 
 		if scanning_mode == "Hybrid Approach":
-			message_without_attachments = get_message_without_attachments(self.message)
+			message_without_attachments = self.get_message_without_attachments()
 			initial_response = scan_message(spamd_host, spamd_port, message_without_attachments)
 			initial_spam_score = extract_spam_score(initial_response)
 
@@ -62,9 +69,9 @@ class SpamCheckLog(Document):
 				response = initial_response
 
 		elif scanning_mode == "Exclude Attachments":
-			self.message = get_message_without_attachments(self.message)
+			message = self.message = self.get_message_without_attachments()
 
-		response = response or scan_message(spamd_host, spamd_port, self.message)
+		response = response or scan_message(spamd_host, spamd_port, message)
 		self.spamd_response = response
 		self.scanning_mode = scanning_mode
 		self.hybrid_scanning_threshold = hybrid_scanning_threshold
@@ -72,6 +79,13 @@ class SpamCheckLog(Document):
 		self.completed_at = now()
 		self.duration = time_diff_in_seconds(self.completed_at, self.started_at)
 
+	def get_message_without_attachments(self) -> str:
+		"""Returns the message without attachments, as given on creation or parsed from the message."""
+
+		return self.flags.message_without_attachments or get_message_without_attachments(
+			self.message
+		)
+
 	def is_spam(self, message_type: Literal["Inbound", "Outbound"]) -> bool:
 		"""Returns True if the message is spam else False"""
 
@@ -87,11 +101,18 @@ class SpamCheckLog(Document):
 		return self.spam_score > max_spam_score
 
 
-def create_spam_check_log(message: str) -> SpamCheckLog:
+def create_spam_check_log(
+	message: str,
+	raw_message: bytes | None = None,
+	message_without_attachments: str | None = None,
+) -> SpamCheckLog:
 	"""Creates a Spam Check Log document"""
 
 	doc = frappe.new_doc("Spam Check Log")
 	doc.message = message
+	# Already serialized forms of the message are scanned as is instead of being encoded or parsed again
+	doc.flags.raw_message = raw_message
+	doc.flags.message_without_attachments = message_without_attachments
 	doc.insert(ignore_permissions=True)
 
 	return doc
@@ -115,7 +136,7 @@ def get_message_without_attachments(message: str) -> str:
 	return message_without_attachments.as_string()
 
 
-def scan_message(host: str, port: int, message: str) -> str:
+def scan_message(host: str, port: int, message: str | bytes) -> str:
 	"""Scans the message for spam"""
 
 	try:
@@ -123,7 +144,7 @@ def scan_message(host: str, port: int, message: str) -> str:
 			sock.settimeout(10)
 			command = "SYMBOLS SPAMC/1.5\r\n\r\n"
 			sock.sendall(command.encode("utf-8"))
-			sock.sendall(message.encode("utf-8"))
+			sock.sendall(message if isinstance(message, bytes) else message.encode("utf-8"))
 			sock.shutdown(socket.SHUT_WR)
 
 			response = ""
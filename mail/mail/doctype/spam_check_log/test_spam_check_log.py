@@ -1,9 +1,30 @@
 # Copyright (c) 2024, Frappe Technologies Pvt. Ltd. and Contributors
 # See license.txt
 
-# import frappe
+import frappe
 from frappe.tests.utils import FrappeTestCase
+from mail.utils.compression import is_compressed
 
 
 class TestSpamCheckLog(FrappeTestCase):
-	pass
+	def test_compressed_message_round_trip(self) -> None:
+		message = "Subject: Test\r\n\r\n" + "The quick brown fox jumps over the lazy dog. " * 100
+
+		doc = frappe.new_doc("Spam Check Log")
+		doc.message = message
+		# Inserted without scanning the message, which needs spamd
+		doc.flags.ignore_validate = True
+		doc.insert(ignore_permissions=True)
+
+		# Loaded and posted back the way the form does
+		doc = frappe.get_doc("Spam Check Log", doc.name)
+		doc.run_method("onload")
+		self.assertEqual(doc.get_onload("compressed_fields")["message"], message)
+
+		form_doc = frappe.get_doc(frappe.parse_json(frappe.as_json(doc.as_dict())))
+		form_doc.spamd_response = "Updated"
+		form_doc.save()
+
+		stored_message = frappe.db.get_value("Spam Check Log", doc.name, "message")
+		self.assertTrue(is_compressed(stored_message))
+		self.assertEqual(frappe.get_doc("Spam Check Log", doc.name).message, message)
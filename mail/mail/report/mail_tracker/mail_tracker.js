@@ -61,5 +61,16 @@ frappe.query_reports["Mail Tracker"] = {
 			label: __("Tracking ID"),
 			fieldtype: "Data",
 		},
+		{
+			fieldname: "recipient",
+			label: __("Recipient"),
+			fieldtype: "Data",
+			depends_on: "eval: doc.show_delivery_events",
+		},
+		{
+			fieldname: "show_delivery_events",
+			label: __("Show Delivery Events"),
+			fieldtype: "Check",
+		},
 	]
 };
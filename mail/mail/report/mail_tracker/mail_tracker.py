@@ -3,16 +3,27 @@
 
 import frappe
 from frappe import _
+from typing import TYPE_CHECKING
 from frappe.query_builder.functions import Date
 from frappe.query_builder import Order, Criterion
 from mail.utils.cache import get_user_owned_domains
 from mail.utils.user import has_role, is_system_manager, get_user_mailboxes
 
+if TYPE_CHECKING:
+	from pypika.queries import QueryBuilder
+
 
 def execute(filters: dict | None = None) -> tuple:
-	columns = get_columns()
-	data = get_data(filters)
-	summary = get_summary(data)
+	filters = filters or {}
+
+	if filters.get("show_delivery_events"):
+		columns = get_delivery_event_columns()
+		data = get_delivery_events(filters)
+		summary = get_delivery_event_summary(data)
+	else:
+		columns = get_columns()
+		data = get_data(filters)
+		summary = get_summary(data)
 
 	return columns, data, None, None, summary
 
@@ -103,13 +114,59 @@ def get_columns() -> list[dict]:
 	]
 
 
+def get_delivery_event_columns() -> list[dict]:
+	return [
+		{
+			"label": _("Outgoing Mail"),
+			"fieldname": "outgoing_mail",
+			"fieldtype": "Link",
+			"options": "Outgoing Mail",
+			"width": 100,
+		},
+		{
+			"label": _("Recipient"),
+			"fieldname": "recipient",
+			"fieldtype": "Data",
+			"width": 200,
+		},
+		{
+			"label": _("Action At"),
+			"fieldname": "action_at",
+			"fieldtype": "Datetime",
+			"width": 180,
+		},
+		{
+			"label": _("Status"),
+			"fieldname": "status",
+			"fieldtype": "Data",
+			"width": 100,
+		},
+		{
+			"label": _("Retries"),
+			"fieldname": "retries",
+			"fieldtype": "Int",
+			"width": 80,
+		},
+		{
+			"label": _("Details"),
+			"fieldname": "details",
+			"fieldtype": "Code",
+			"width": 500,
+		},
+	]
+
+
 def get_data(filters: dict | None = None) -> list[list]:
 	filters = filters or {}
 
 	OM = frappe.qb.DocType("Outgoing Mail")
-	query = (
-		frappe.qb.from_(OM)
-		.select(
+	query = get_outgoing_mails_query(filters)
+
+	if not query:
+		return []
+
+	return (
+		query.select(
 			OM.name,
 			OM.creation,
 			OM.status,
@@ -123,11 +180,49 @@ def get_data(filters: dict | None = None) -> list[list]:
 			OM.first_opened_at,
 			OM.last_opened_at,
 			OM.last_opened_from_ip,
+		).orderby(OM.creation, OM.created_at, order=Order.desc)
+	).run(as_dict=True)
+
+
+def get_delivery_events(filters: dict | None = None) -> list[dict]:
+	"""Returns the delivery events of the recipients of the filtered mails, as a timeline per recipient."""
+
+	filters = filters or {}
+
+	OM = frappe.qb.DocType("Outgoing Mail")
+	MDE = frappe.qb.DocType("Mail Delivery Event")
+	query = get_outgoing_mails_query(filters)
+
+	if not query:
+		return []
+
+	query = (
+		query.join(MDE)
+		.on(MDE.outgoing_mail == OM.name)
+		.select(
+			MDE.outgoing_mail,
+			MDE.recipient,
+			MDE.action_at,
+			MDE.status,
+			MDE.retries,
+			MDE.details,
 		)
-		.where((OM.docstatus == 1) & (OM.tracking_id.isnotnull()))
 		.orderby(OM.creation, OM.created_at, order=Order.desc)
+		.orderby(MDE.recipient, MDE.action_at, MDE.name)
 	)
 
+	if filters.get("recipient"):
+		query = query.where(MDE.recipient == filters.get("recipient"))
+
+	return query.run(as_dict=True)
+
+
+def get_outgoing_mails_query(filters: dict) -> "QueryBuilder | None":
+	"""Returns the query of the tracked mails matching the filters, `None` if the user can see none."""
+
+	OM = frappe.qb.DocType("Outgoing Mail")
+	query = frappe.qb.from_(OM).where((OM.docstatus == 1) & (OM.tracking_id.isnotnull()))
+
 	if (
 		not filters.get("name")
 		and not filters.get("message_id")
@@ -163,11 +258,38 @@ def get_data(filters: dict | None = None) -> list[list]:
 			conditions.append(OM.sender.isin(mailboxes))
 
 		if not conditions:
-			return []
+			return None
 
 		query = query.where(Criterion.any(conditions))
 
-	return query.run(as_dict=True)
+	return query
+
+
+def get_delivery_event_summary(data: list[dict]) -> list[dict]:
+	status_count = {"Sent": 0, "Deferred": 0, "Bounced": 0}
+	for row in data:
+		status_count[row["status"]] = status_count.get(row["status"], 0) + 1
+
+	return [
+		{
+			"label": _("Total Sent"),
+			"datatype": "Int",
+			"value": status_count["Sent"],
+			"indicator": "green",
+		},
+		{
+			"label": _("Total Deferred"),
+			"datatype": "Int",
+			"value": status_count["Deferred"],
+			"indicator": "orange",
+		},
+		{
+			"label": _("Total Bounced"),
+			"datatype": "Int",
+			"value": status_count["Bounced"],
+			"indicator": "red",
+		},
+	]
 
 
 def get_summary(data: dict) -> list[dict]:
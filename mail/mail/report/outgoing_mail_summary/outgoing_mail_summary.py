@@ -138,7 +138,6 @@ def get_data(filters: dict | None = None) -> list[list]:
 			OM.via_api,
 			OM.is_newsletter,
 			OM.spam_score,
-			MR.details.as_("response"),
 			OM.agent,
 			OM.domain_name,
 			OM.ip_address,
@@ -193,9 +192,10 @@ def get_data(filters: dict | None = None) -> list[list]:
 		query = query.where(Criterion.any(conditions))
 
 	data = query.run(as_dict=True)
+	details = get_latest_delivery_details(list({row["name"] for row in data}))
 
 	for row in data:
-		response = json.loads(row["response"])
+		response = json.loads(details.get((row["name"], row["recipient"])) or "{}")
 		row["response"] = (
 			response.get("dsn_msg")
 			or response.get("reason")
@@ -206,6 +206,25 @@ def get_data(filters: dict | None = None) -> list[list]:
 	return data
 
 
+def get_latest_delivery_details(outgoing_mails: list[str]) -> dict[tuple[str, str], str]:
+	"""Returns the details of the latest delivery event of each recipient of the Outgoing Mails."""
+
+	MDE = frappe.qb.DocType("Mail Delivery Event")
+	details = {}
+
+	for i in range(0, len(outgoing_mails), 1000):
+		for event in (
+			frappe.qb.from_(MDE)
+			.select(MDE.outgoing_mail, MDE.recipient, MDE.details)
+			.where(MDE.outgoing_mail.isin(outgoing_mails[i : i + 1000]))
+			.orderby(MDE.action_at)
+			.orderby(MDE.name)
+		).run(as_dict=True):
+			details[(event.outgoing_mail, event.recipient)] = event.details
+
+	return details
+
+
 def get_chart(data: list) -> list[dict]:
 	labels, sent, deffered, bounced = [], [], [], []
 
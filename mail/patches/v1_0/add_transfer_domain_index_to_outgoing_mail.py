@@ -0,0 +1,5 @@
+from mail.mail.doctype.outgoing_mail.outgoing_mail import on_doctype_update
+
+
+def execute():
+	on_doctype_update()
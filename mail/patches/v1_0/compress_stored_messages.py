@@ -0,0 +1,45 @@
+import frappe
+from frappe.query_builder import Criterion
+from mail.utils.compression import COMPRESSED_PREFIX, compress
+
+CHUNK_SIZE = 100
+
+
+def execute():
+	compressed_fields = {
+		"Outgoing Mail": ["message", "raw_message"],
+		"Incoming Mail": ["message"],
+		"Spam Check Log": ["message"],
+	}
+
+	for doctype, fields in compressed_fields.items():
+		DT = frappe.qb.DocType(doctype)
+		last_name = ""
+
+		while True:
+			# Rows are walked by name, so that each chunk is a range scan on the primary key
+			rows = (
+				frappe.qb.from_(DT)
+				.select(DT.name, *[DT[field] for field in fields])
+				.where(
+					(DT.name > last_name)
+					& Criterion.any(
+						[
+							DT[field].isnotnull() & DT[field].not_like(f"{COMPRESSED_PREFIX}%")
+							for field in fields
+						]
+					)
+				)
+				.orderby(DT.name)
+				.limit(CHUNK_SIZE)
+			).run(as_dict=True)
+
+			if not rows:
+				break
+
+			for row in rows:
+				if values := {field: compress(row[field]) for field in fields if row[field]}:
+					frappe.db.set_value(doctype, row.name, values, update_modified=False)
+
+			frappe.db.commit()
+			last_name = rows[-1].name
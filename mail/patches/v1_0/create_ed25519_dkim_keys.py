@@ -0,0 +1,12 @@
+import frappe
+from mail.mail.doctype.dkim_key.dkim_key import create_dkim_key
+
+
+def execute():
+	frappe.db.set_value("DKIM Key", {"key_type": ("in", ["", None])}, "key_type", "RSA")
+
+	for mail_domain in frappe.db.get_all("Mail Domain", pluck="name"):
+		if not frappe.db.exists(
+			"DKIM Key", {"domain_name": mail_domain, "key_type": "Ed25519", "enabled": 1}
+		):
+			create_dkim_key(mail_domain, key_type="Ed25519")
@@ -0,0 +1,48 @@
+import json
+import frappe
+from mail.mail.doctype.mail_delivery_event.mail_delivery_event import insert_mail_delivery_events
+
+CHUNK_SIZE = 1000
+
+
+def execute():
+	if not frappe.db.has_column("Mail Recipient", "details"):
+		return
+
+	MR = frappe.qb.DocType("Mail Recipient")
+	last_name = ""
+
+	while True:
+		# The column is no longer a field of Mail Recipient, but it is kept in the table until trimmed
+		rows = (
+			frappe.qb.from_(MR)
+			.select(MR.name, MR.parent, MR.email, MR.status, MR.retries, MR.action_at, MR.details)
+			.where(
+				(MR.name > last_name)
+				& (MR.parenttype == "Outgoing Mail")
+				& MR.details.isnotnull()
+				& MR.action_at.isnotnull()
+				& (MR.status.isin(["Deferred", "Bounced", "Sent"]))
+			)
+			.orderby(MR.name)
+			.limit(CHUNK_SIZE)
+		).run(as_dict=True)
+
+		if not rows:
+			break
+
+		insert_mail_delivery_events(
+			[
+				{
+					"outgoing_mail": row.parent,
+					"recipient": row.email,
+					"status": row.status,
+					"retries": row.retries,
+					"action_at": row.action_at,
+					"details": json.dumps(json.loads(row.details), separators=(",", ":")),
+				}
+				for row in rows
+			]
+		)
+		frappe.db.commit()
+		last_name = rows[-1].name
@@ -0,0 +1,13 @@
+frappe.provide("mail");
+
+mail.render_compressed_fields = (frm) => {
+    // The compressed fields keep their stored value in the document, their text is sent in `__onload`
+    Object.entries(frm.doc.__onload?.compressed_fields || {}).forEach(([fieldname, value]) => {
+        const field = frm.get_field(fieldname);
+
+        if (field && value && field.get_status() !== "Write") {
+            field.$wrapper.removeClass("hide-control");
+            $(field.disp_area).html(frappe.form.formatters.Code(value)).show();
+        }
+    });
+};
@@ -1,9 +1,11 @@
+import time
 import pika
 import frappe
 import threading
 from queue import Queue
 from contextlib import contextmanager
-from typing import Any, Generator, TYPE_CHECKING
+from typing import Any, Callable, Generator, Iterable, TYPE_CHECKING
+from mail.utils import reset_local_caches, rollback_or_reconnect
 
 if TYPE_CHECKING:
 	from pika import BlockingConnection
@@ -99,22 +101,135 @@ class RabbitMQ:
 			properties=properties,
 		)
 
+	def publish_many(
+		self,
+		routing_key: str,
+		messages: Iterable[tuple[str, int]],
+		exchange: str = "",
+		persistent: bool = True,
+		window_size: int = 1000,
+		timeout: int = 60,
+	) -> list[bool]:
+		"""Publishes the (body, priority) messages with publisher confirms and returns if each one was acked.
+
+		Up to `window_size` messages are awaiting their confirm at a time. Messages nacked by the broker, or
+		left unconfirmed when no confirm arrives for `timeout` seconds, are reported as not acked. If the
+		connection fails, the messages published so far are reported and the rest are not consumed.
+		"""
+
+		results: list[bool | None] = []
+		pending: dict[int, int] = {}
+		selected = False
+
+		def on_select_ok(frame) -> None:
+			nonlocal selected
+			selected = True
+
+		def on_confirm(frame) -> None:
+			nonlocal deadline
+			deadline = time.monotonic() + timeout
+			acked = isinstance(frame.method, pika.spec.Basic.Ack)
+			delivery_tag = frame.method.delivery_tag
+
+			if frame.method.multiple:
+				delivery_tags = [tag for tag in pending if tag <= delivery_tag]
+			else:
+				delivery_tags = [delivery_tag]
+
+			for tag in delivery_tags:
+				if (idx := pending.pop(tag, None)) is not None:
+					results[idx] = acked
+
+		def wait(condition: callable) -> bool:
+			while not condition():
+				if time.monotonic() > deadline:
+					return False
+				connection.process_data_events(time_limit=0.1)
+
+			return True
+
+		connection = self.connection
+		blocking_channel = connection.channel()
+		# The confirms are tracked on the underlying channel, as the blocking channel waits for each one
+		channel = blocking_channel._impl
+		deadline = time.monotonic() + timeout
+
+		try:
+			channel.confirm_delivery(ack_nack_callback=on_confirm, callback=on_select_ok)
+			if not wait(lambda: selected):
+				raise TimeoutError("RabbitMQ did not enable publisher confirms in time.")
+
+			for body, priority in messages:
+				if not wait(lambda: len(pending) < window_size):
+					results.append(False)
+					continue
+
+				properties = pika.BasicProperties(
+					delivery_mode=pika.DeliveryMode.Persistent if persistent else None,
+					priority=priority if priority > 0 else None,
+				)
+				channel.basic_publish(
+					exchange=exchange, routing_key=routing_key, body=body, properties=properties
+				)
+
+				# Delivery tags are numbered from 1 on the channel, in the order of publishing
+				results.append(None)
+				pending[len(results)] = len(results) - 1
+
+				if len(results) % 100 == 0:
+					connection.process_data_events(time_limit=0)
+
+			wait(lambda: not pending)
+		except pika.exceptions.AMQPError:
+			# The messages confirmed so far are reported, so that they are not published again
+			frappe.log_error(
+				title="RabbitMQ Publish", message=frappe.get_traceback(with_context=False)
+			)
+		finally:
+			if blocking_channel.is_open:
+				blocking_channel.close()
+
+		return [bool(result) for result in results]
+
 	def consume(
 		self,
 		queue: str,
 		callback: callable,
 		auto_ack: bool = False,
 		prefetch_count: int = 0,
+		should_stop: Callable[[], bool] | None = None,
+		on_tick: Callable[[], None] | None = None,
 	) -> None:
-		"""Consumes messages from the queue with the given callback."""
+		"""Consumes messages from the queue with the given callback.
+
+		If `should_stop` is given, it is checked about every second and the consumer is cancelled once it
+		returns True, `on_tick` is called at the same pace and once more before cancelling.
+		"""
+
+		channel = self.channel
 
 		if prefetch_count > 0:
-			self.channel.basic_qos(prefetch_count=prefetch_count)
+			channel.basic_qos(prefetch_count=prefetch_count)
 
-		self.channel.basic_consume(
+		consumer_tag = channel.basic_consume(
 			queue=queue, on_message_callback=callback, auto_ack=auto_ack
 		)
-		self.channel.start_consuming()
+
+		if not should_stop:
+			channel.start_consuming()
+			return
+
+		while not should_stop():
+			self.connection.process_data_events(time_limit=1)
+
+			if on_tick:
+				on_tick()
+
+		if on_tick:
+			on_tick()
+
+		# The messages delivered but not acknowledged yet are requeued by the broker
+		channel.basic_cancel(consumer_tag)
 
 	def basic_get(
 		self,
@@ -216,20 +331,148 @@ class RabbitMQConnectionPool:
 			self._condition.notify_all()
 
 
-@contextmanager
-def rabbitmq_context() -> Generator[RabbitMQ, None, None]:
-	"""Context manager to get a RabbitMQ connection from the pool."""
+class RabbitMQConsumer:
+	"""Consumes a queue in a long-running process until it receives SIGTERM or SIGINT.
+
+	A message that fails is logged and rejected, it is not redelivered. If the database connection is lost,
+	the messages not acknowledged yet are redelivered. If the RabbitMQ connection is lost, they are
+	requeued and the consumer reconnects after `reconnect_interval` seconds.
+	"""
+
+	queue: str
+	max_priority: int = 0
+	prefetch_count: int = 100
+	reconnect_interval: int = 5
+
+	def __init__(self) -> None:
+		self.stopped = False
+		self.channel: "BlockingChannel | None" = None
+
+	def on_message(
+		self, channel: "BlockingChannel", method: Any, properties: Any, body: bytes
+	) -> None:
+		"""Processes a message, it must be acknowledged on the channel once its changes are committed."""
+
+		raise NotImplementedError
+
+	def on_connect(self) -> None:
+		"""Called before consuming on every connection, the delivery tags of a lost one are invalid."""
+
+		pass
+
+	def on_tick(self) -> None:
+		"""Called about every second while consuming and once more before stopping."""
+
+		pass
+
+	def stop(self, signum: int | None = None, frame: Any = None) -> None:
+		"""Stops consuming once the current message is processed."""
+
+		self.stopped = True
+
+	def handle_error(self, body: bytes | None = None) -> bool:
+		"""Rolls back and logs the error, returns False if the unacknowledged messages are redelivered."""
+
+		if not rollback_or_reconnect():
+			# The messages were not processed because of the connection, they are retried
+			self.channel.basic_recover(requeue=True)
+			self.on_connect()
+			return False
+
+		message = frappe.get_traceback(with_context=False)
+		if body:
+			message += "\n\n" + body.decode("utf-8", errors="replace")
+
+		frappe.log_error(title=f"RabbitMQ Consumer: {self.queue}", message=message)
+		frappe.db.commit()
+		return True
+
+	def _on_message(
+		self, channel: "BlockingChannel", method: Any, properties: Any, body: bytes
+	) -> None:
+		reset_local_caches()
+
+		try:
+			self.on_message(channel, method, properties, body)
+		except pika.exceptions.AMQPError:
+			raise
+		except Exception:
+			if self.handle_error(body):
+				# Logged with its body, a message that fails would fail again on every redelivery
+				channel.basic_reject(delivery_tag=method.delivery_tag, requeue=False)
+
+	def _on_tick(self) -> None:
+		reset_local_caches()
+
+		try:
+			self.on_tick()
+		except pika.exceptions.AMQPError:
+			raise
+		except Exception:
+			self.handle_error()
+
+	def run(self) -> None:
+		"""Consumes the queue until the consumer is stopped."""
+
+		import signal
+
+		signal.signal(signal.SIGTERM, self.stop)
+		signal.signal(signal.SIGINT, self.stop)
+
+		while not self.stopped:
+			rmq = None
+
+			try:
+				# A connection of its own, the consumer would otherwise hold one of the pool forever
+				rmq = RabbitMQ(**get_connection_settings())
+				rmq.declare_queue(self.queue, max_priority=self.max_priority)
+				self.channel = rmq.channel
+				self.on_connect()
+				rmq.consume(
+					self.queue,
+					self._on_message,
+					prefetch_count=self.prefetch_count,
+					should_stop=lambda: self.stopped,
+					on_tick=self._on_tick,
+				)
+			except pika.exceptions.AMQPError:
+				rollback_or_reconnect()
+				frappe.log_error(
+					title=f"RabbitMQ Consumer: {self.queue}",
+					message=frappe.get_traceback(with_context=False),
+				)
+				frappe.db.commit()
+
+				for __ in range(self.reconnect_interval):
+					if self.stopped:
+						break
+					time.sleep(1)
+			finally:
+				self.channel = None
+				if rmq:
+					rmq._disconnect()
+
+
+def get_connection_settings() -> dict:
+	"""Returns the parameters of the connection to the RabbitMQ server from the Mail Settings."""
 
 	mail_settings = frappe.get_cached_doc("Mail Settings")
-	pool = RabbitMQConnectionPool(
-		host=mail_settings.rmq_host,
-		port=mail_settings.rmq_port,
-		virtual_host=mail_settings.rmq_virtual_host,
-		username=mail_settings.rmq_username,
-		password=mail_settings.get_password("rmq_password")
+	return {
+		"host": mail_settings.rmq_host,
+		"port": mail_settings.rmq_port,
+		"virtual_host": mail_settings.rmq_virtual_host,
+		"username": mail_settings.rmq_username,
+		"password": mail_settings.get_password("rmq_password")
 		if mail_settings.rmq_password
 		else None,
-	)
+	}
+
+
+@contextmanager
+def rabbitmq_context() -> Generator[RabbitMQ, None, None]:
+	"""Context manager to get a RabbitMQ connection from the pool."""
+
+	pool = RabbitMQConnectionPool(**get_connection_settings())
 	connection: RabbitMQ | None = None
 
 	try:
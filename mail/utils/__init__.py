@@ -171,3 +171,100 @@ def parse_iso_datetime(
 	)
 
 	return get_datetime_str(dt) if as_str else dt
+
+
+def delete_attachments(doctype: str, names: list[str], chunk_size: int = 1000) -> None:
+	"""Deletes the files attached to the given documents and the contents no longer referenced by any file."""
+
+	# Frappe writes identical contents once (looked up by the File `content_hash`) and shares the
+	# `file_url` between File records, so a content is only removed from disk with its last reference.
+	FILE = frappe.qb.DocType("File")
+	file_urls = set()
+
+	for i in range(0, len(names), chunk_size):
+		files = (
+			frappe.qb.from_(FILE)
+			.select(FILE.name, FILE.file_url)
+			.where(
+				(FILE.attached_to_doctype == doctype)
+				& (FILE.attached_to_name.isin(names[i : i + chunk_size]))
+			)
+		).run(as_dict=True)
+
+		if files:
+			frappe.db.delete("File", {"name": ["in", [file.name for file in files]]})
+			file_urls.update(file.file_url for file in files if file.file_url)
+
+	if not file_urls:
+		return
+
+	file_urls = list(file_urls)
+	referenced_file_urls = set()
+	for i in range(0, len(file_urls), chunk_size):
+		referenced_file_urls.update(
+			(
+				frappe.qb.from_(FILE)
+				.select(FILE.file_url)
+				.distinct()
+				.where(FILE.file_url.isin(file_urls[i : i + chunk_size]))
+			).run(pluck="file_url")
+		)
+
+	if unreferenced_file_urls := set(file_urls) - referenced_file_urls:
+
+		def delete_contents() -> None:
+			from frappe.utils.file_manager import delete_file
+
+			for file_url in unreferenced_file_urls:
+				delete_file(file_url)
+
+		frappe.db.after_commit.add(delete_contents)
+
+
+def bulk_update(doctype: str, updates: dict[str, dict], chunk_size: int = 500) -> None:
+	"""Updates the values `{name: {field: value}}` of many documents with one query per chunk."""
+
+	from frappe.query_builder import Case
+
+	table = frappe.qb.DocType(doctype)
+	names = list(updates)
+
+	for i in range(0, len(names), chunk_size):
+		chunk = names[i : i + chunk_size]
+		fields = {field for name in chunk for field in updates[name]}
+		query = frappe.qb.update(table).where(table.name.isin(chunk))
+
+		for field in fields:
+			case = Case()
+			for name in chunk:
+				if field in updates[name]:
+					case = case.when(table.name == name, updates[name][field])
+
+			# Documents without a value for the field keep their current one
+			query = query.set(table[field], case.else_(table[field]))
+
+		query.run()
+
+
+def reset_local_caches() -> None:
+	"""Clears the request-local caches, to be called between the runs of a long-running process."""
+
+	frappe.local.cache = {}
+	frappe.local.document_cache = {}
+
+
+def rollback_or_reconnect() -> bool:
+	"""Rolls back the transaction, reconnects and returns False if the database connection was lost."""
+
+	try:
+		frappe.db.rollback()
+		return True
+	except Exception:
+		# e.g. the idle connection was closed by the server, the next query connects again
+		try:
+			frappe.db.close()
+		except Exception:
+			frappe.db._conn = frappe.db._cursor = None
+
+		frappe.db.connect()
+		return False
@@ -0,0 +1,369 @@
+import os
+import mmap
+import time
+import frappe
+from io import BytesIO
+from hashlib import sha256
+from frappe.utils import cint
+from typing import IO, Iterable, Iterator
+from abc import ABC, abstractmethod
+from tempfile import NamedTemporaryFile
+from mail.config.constants import BLOB_GRACE_PERIOD
+
+_blob_stores: dict[tuple, "BlobStore"] = {}
+
+
+class BlobStore(ABC):
+	"""Content addressed store of raw messages, a blob is referenced by the SHA-256 hash of its content."""
+
+	backend: str
+
+	@staticmethod
+	def get_key(data: bytes) -> str:
+		"""Returns the key of the content."""
+
+		return sha256(data).hexdigest()
+
+	@abstractmethod
+	def put(self, data: bytes) -> str:
+		"""Stores the content if it is not stored yet, refreshes its modification time else, returns its key."""
+		pass
+
+	@abstractmethod
+	def open(self, key: str) -> IO[bytes]:
+		"""Returns the blob for reading, without reading it into memory where the backend allows it."""
+		pass
+
+	def get(self, key: str) -> str:
+		"""Returns the content of the blob as text."""
+
+		with self.open(key) as file:
+			return file.read().decode("utf-8")
+
+	@abstractmethod
+	def delete(self, keys: Iterable[str]) -> None:
+		"""Deletes the blobs, missing blobs are ignored."""
+		pass
+
+	@abstractmethod
+	def get_modified_at(self, key: str) -> float | None:
+		"""Returns the timestamp the blob was last put at, `None` if it does not exist."""
+		pass
+
+	@abstractmethod
+	def list(self) -> Iterator[tuple[str, float]]:
+		"""Yields the key and the modification timestamp of every blob."""
+		pass
+
+
+class LocalBlobStore(BlobStore):
+	"""Stores the blobs as files named by their key in a directory of the local filesystem."""
+
+	backend = "local"
+
+	def __init__(self, path: str) -> None:
+		self.path = path
+		os.makedirs(self.path, exist_ok=True)
+
+	def get_path(self, key: str) -> str:
+		"""Returns the path of the blob, spread over subdirectories by the first characters of the key."""
+
+		return os.path.join(self.path, key[:2], key[2:4], key)
+
+	def put(self, data: bytes) -> str:
+		key = self.get_key(data)
+		path = self.get_path(key)
+
+		try:
+			os.utime(path)
+		except FileNotFoundError:
+			os.makedirs(os.path.dirname(path), exist_ok=True)
+
+			# Written to a temporary file first, so that a blob is never read partially written
+			with NamedTemporaryFile(prefix=".", dir=os.path.dirname(path), delete=False) as file:
+				file.write(data)
+
+			os.replace(file.name, path)
+
+		return key
+
+	def open(self, key: str) -> IO[bytes]:
+		with open(self.get_path(key), "rb") as file:
+			if not os.fstat(file.fileno()).st_size:
+				return BytesIO()
+
+			# The pages of the blob are only loaded when they are read
+			return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+	def get(self, key: str) -> str:
+		with self.open(key) as file:
+			# Decoded from the mapped pages without copying them into bytes first
+			return str(memoryview(file), "utf-8") if isinstance(file, mmap.mmap) else ""
+
+	def delete(self, keys: Iterable[str]) -> None:
+		for key in keys:
+			try:
+				os.remove(self.get_path(key))
+			except FileNotFoundError:
+				pass
+
+	def get_modified_at(self, key: str) -> float | None:
+		try:
+			return os.stat(self.get_path(key)).st_mtime
+		except FileNotFoundError:
+			return None
+
+	def list(self) -> Iterator[tuple[str, float]]:
+		for root, __, filenames in os.walk(self.path):
+			for filename in filenames:
+				# Skip the blobs that are still being written
+				if filename.startswith("."):
+					continue
+
+				try:
+					yield filename, os.stat(os.path.join(root, filename)).st_mtime
+				except FileNotFoundError:
+					continue
+
+
+class S3BlobStore(BlobStore):
+	"""Stores the blobs as objects named by their key in a bucket of an S3 compatible storage."""
+
+	backend = "s3"
+
+	def __init__(
+		self,
+		bucket: str,
+		endpoint_url: str | None = None,
+		region: str | None = None,
+		access_key: str | None = None,
+		secret_key: str | None = None,
+	) -> None:
+		import boto3
+
+		self.bucket = bucket
+		self.client = boto3.client(
+			"s3",
+			endpoint_url=endpoint_url or None,
+			region_name=region or None,
+			aws_access_key_id=access_key or None,
+			aws_secret_access_key=secret_key or None,
+		)
+
+	def put(self, data: bytes) -> str:
+		from botocore.exceptions import ClientError
+
+		key = self.get_key(data)
+
+		try:
+			self.client.head_object(Bucket=self.bucket, Key=key)
+		except ClientError:
+			self.client.put_object(Bucket=self.bucket, Key=key, Body=data)
+		else:
+			# Copied onto itself within the storage, which refreshes its modification time
+			self.client.copy_object(
+				Bucket=self.bucket,
+				Key=key,
+				CopySource={"Bucket": self.bucket, "Key": key},
+				MetadataDirective="REPLACE",
+			)
+
+		return key
+
+	def open(self, key: str) -> IO[bytes]:
+		# The body is streamed from the storage as it is read
+		return self.client.get_object(Bucket=self.bucket, Key=key)["Body"]
+
+	def delete(self, keys: Iterable[str]) -> None:
+		keys = list(keys)
+
+		# At most 1000 objects can be deleted per request
+		for i in range(0, len(keys), 1000):
+			self.client.delete_objects(
+				Bucket=self.bucket,
+				Delete={"Objects": [{"Key": key} for key in keys[i : i + 1000]], "Quiet": True},
+			)
+
+	def get_modified_at(self, key: str) -> float | None:
+		from botocore.exceptions import ClientError
+
+		try:
+			return self.client.head_object(Bucket=self.bucket, Key=key)["LastModified"].timestamp()
+		except ClientError:
+			return None
+
+	def list(self) -> Iterator[tuple[str, float]]:
+		paginator = self.client.get_paginator("list_objects_v2")
+
+		for page in paginator.paginate(Bucket=self.bucket):
+			for obj in page.get("Contents", []):
+				yield obj["Key"], obj["LastModified"].timestamp()
+
+
+def get_blob_store(backend: str | None = None) -> BlobStore | None:
+	"""Returns the blob store of the given backend, by default the one set in the Mail Settings, `None` if not set."""
+
+	mail_settings = frappe.get_cached_doc("Mail Settings")
+	backend = backend or (mail_settings.blob_store or "").lower()
+
+	if backend == "local":
+		path = os.path.abspath(
+			mail_settings.blob_store_path or frappe.get_site_path("private", "blobs")
+		)
+		settings = (backend, path)
+
+		if settings not in _blob_stores:
+			_blob_stores[settings] = LocalBlobStore(path)
+
+	elif backend == "s3":
+		settings = (
+			backend,
+			mail_settings.s3_bucket,
+			mail_settings.s3_endpoint_url,
+			mail_settings.s3_region,
+			mail_settings.s3_access_key,
+			mail_settings.get_password("s3_secret_key", raise_exception=False),
+		)
+
+		if settings not in _blob_stores:
+			_blob_stores[settings] = S3BlobStore(*settings[1:])
+
+	else:
+		return None
+
+	return _blob_stores[settings]
+
+
+def get_blob_store_min_size() -> int:
+	"""Returns the size in bytes from which raw messages are stored in the blob store."""
+
+	return cint(frappe.get_cached_doc("Mail Settings").blob_store_min_size) * 1024
+
+
+def put_blob(data: str | bytes) -> str | None:
+	"""Stores the content in the blob store of the Mail Settings and returns its reference, `None` if not stored.
+
+	Contents smaller than the minimum size are not stored, they are cheaper to keep in the database.
+	"""
+
+	if not (blob_store := get_blob_store()) or len(data) < get_blob_store_min_size():
+		return None
+
+	if isinstance(data, str):
+		data = data.encode("utf-8")
+
+	reference = f"{blob_store.backend}:{blob_store.put(data)}"
+
+	# The blob is written before the mail is committed, it is deleted if the mail is rolled back
+	if (new_blobs := frappe.local.flags.get("new_blobs")) is None:
+		new_blobs = frappe.local.flags.new_blobs = set()
+		frappe.db.after_commit.add(lambda: frappe.local.flags.pop("new_blobs", None))
+		frappe.db.after_rollback.add(
+			lambda: delete_unreferenced_blobs(frappe.local.flags.pop("new_blobs", None) or [])
+		)
+
+	new_blobs.add(reference)
+
+	return reference
+
+
+def get_new_blobs() -> set[str]:
+	"""Returns the references of the blobs written by the transaction so far, see `put_blob`."""
+
+	return set(frappe.local.flags.get("new_blobs") or ())
+
+
+def discard_new_blobs(before: set[str], keep: Iterable[str | None] = ()) -> None:
+	"""Deletes the blobs written since `before`, e.g. by a mail that failed, unless kept or referenced.
+
+	The transaction goes on and is committed, so these blobs would not be deleted on rollback.
+	"""
+
+	if not (new_blobs := frappe.local.flags.get("new_blobs")):
+		return
+
+	if discarded := new_blobs - before - set(keep):
+		new_blobs -= discarded
+		delete_unreferenced_blobs(discarded)
+
+
+def get_blob(reference: str) -> str:
+	"""Returns the content of the referenced blob as text."""
+
+	backend, key = reference.split(":", 1)
+	return get_blob_store(backend).get(key)
+
+
+def get_message_blobs(doctype: str, filters: dict) -> list[str]:
+	"""Returns the blob references of the messages of the mails matching the filters."""
+
+	return frappe.db.get_all(
+		doctype, filters={**filters, "message_blob": ["is", "set"]}, pluck="message_blob"
+	)
+
+
+def delete_blobs(references: Iterable[str | None]) -> None:
+	"""Deletes the referenced blobs once the transaction is committed, if no other mail references them."""
+
+	if references := {reference for reference in references if reference}:
+		frappe.db.after_commit.add(lambda: delete_unreferenced_blobs(references))
+
+
+def delete_unreferenced_blobs(references: Iterable[str]) -> None:
+	"""Deletes the referenced blobs that no mail references and that were not put in the grace period.
+
+	A blob put again recently may be referenced by a transaction not committed yet, as the same content is
+	stored under the same key. It is left to `delete_orphaned_blobs`. A blob put again between its check
+	and its deletion is still lost, the window is that of a single request to the blob store.
+	"""
+
+	if not (unreferenced := set(references)):
+		return
+
+	for doctype in ("Outgoing Mail", "Incoming Mail"):
+		# The same content, e.g. an incoming mail for an alias, is stored once for all the mails
+		unreferenced -= set(
+			frappe.db.get_all(
+				doctype,
+				filters={"message_blob": ["in", list(unreferenced)]},
+				pluck="message_blob",
+				distinct=True,
+			)
+		)
+
+		if not unreferenced:
+			return
+
+	keys_by_backend = {}
+	for reference in unreferenced:
+		backend, key = reference.split(":", 1)
+		keys_by_backend.setdefault(backend, []).append(key)
+
+	expires_before = time.time() - BLOB_GRACE_PERIOD
+	for backend, keys in keys_by_backend.items():
+		if blob_store := get_blob_store(backend):
+			blob_store.delete(
+				key
+				for key in keys
+				if (modified_at := blob_store.get_modified_at(key)) and modified_at < expires_before
+			)
+
+
+def delete_orphaned_blobs(chunk_size: int = 1000) -> None:
+	"""Called by the scheduler to delete the blobs that no mail references, e.g. of rolled back mails."""
+
+	if not (blob_store := get_blob_store()):
+		return
+
+	expires_before = time.time() - BLOB_GRACE_PERIOD
+	references = []
+
+	for key, modified_at in blob_store.list():
+		if modified_at < expires_before:
+			references.append(f"{blob_store.backend}:{key}")
+
+		if len(references) >= chunk_size:
+			delete_unreferenced_blobs(references)
+			references = []
+
+	delete_unreferenced_blobs(references)
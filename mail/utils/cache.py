@@ -1,5 +1,6 @@
 import frappe
 from typing import Any
+from mail.config.constants import QUEUE_ID_KEY_EXPIRY, QUEUE_ID_KEY_PREFIX
 
 
 def _get_or_set(
@@ -142,3 +143,42 @@ def get_blacklist_for_ip_group(ip_group: str) -> list:
 		).run(as_dict=True)
 
 	return _get_or_set(f"blacklist|{ip_group}", getter, expires_in_sec=24 * 60 * 60)
+
+
+def get_dkim_signers_version(domain_name: str) -> str:
+	"""Returns the version of the DKIM signers of the domain, which changes whenever they are invalidated."""
+
+	def getter() -> str:
+		return frappe.generate_hash(length=10)
+
+	return _hget_or_hset("dkim_signers_version", domain_name, getter)
+
+
+def set_outgoing_mails_by_queue_id(outgoing_mails: dict[str, str]) -> None:
+	"""Caches the Outgoing Mail of each Queue ID, `{queue_id: outgoing_mail}`, for a week."""
+
+	if not outgoing_mails:
+		return
+
+	pipeline = frappe.cache.pipeline()
+	for queue_id, outgoing_mail in outgoing_mails.items():
+		key = frappe.cache.make_key(f"{QUEUE_ID_KEY_PREFIX}{queue_id}")
+		pipeline.set(key, outgoing_mail, ex=QUEUE_ID_KEY_EXPIRY)
+	pipeline.execute()
+
+
+def get_outgoing_mails_by_queue_id(queue_ids: list[str]) -> dict[str, str]:
+	"""Returns the cached Outgoing Mail of each Queue ID, the ones not cached are left out."""
+
+	if not queue_ids:
+		return {}
+
+	outgoing_mails = frappe.cache.mget(
+		[frappe.cache.make_key(f"{QUEUE_ID_KEY_PREFIX}{queue_id}") for queue_id in queue_ids]
+	)
+
+	return {
+		queue_id: outgoing_mail.decode()
+		for queue_id, outgoing_mail in zip(queue_ids, outgoing_mails)
+		if outgoing_mail
+	}
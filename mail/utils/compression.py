@@ -0,0 +1,119 @@
+import zlib
+from base64 import b64decode, b64encode
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+	from frappe.model.document import Document
+
+# A line starting with a colon is not a valid header, so a raw message never starts with the prefix
+COMPRESSED_PREFIX = ":zlib:"
+COMPRESSION_LEVEL = 6
+
+
+def is_compressed(value: str | None) -> bool:
+	"""Returns True if the value is compressed."""
+
+	return bool(value) and value.startswith(COMPRESSED_PREFIX)
+
+
+def compress(value: str | bytes | None) -> str | None:
+	"""Returns the value compressed and base64 encoded, or as is if compressing does not make it smaller."""
+
+	if not value or (isinstance(value, str) and is_compressed(value)):
+		return value
+
+	data = value.encode("utf-8") if isinstance(value, str) else value
+	compressed = COMPRESSED_PREFIX + b64encode(zlib.compress(data, COMPRESSION_LEVEL)).decode()
+
+	if len(compressed) >= len(data):
+		return value if isinstance(value, str) else value.decode("utf-8")
+
+	return compressed
+
+
+def decompress(value: str | None) -> str | None:
+	"""Returns the decompressed value, values stored before compression are returned as is."""
+
+	if not is_compressed(value):
+		return value
+
+	return zlib.decompress(b64decode(value[len(COMPRESSED_PREFIX) :])).decode("utf-8")
+
+
+class CompressedField:
+	"""Stores a Document field compressed, as it is saved in the database, and decompresses it on first read.
+
+	If a `blob_field` is given, large values are stored in the blob store of the Mail Settings instead and
+	only their reference is kept in the `blob_field`. `doc.get(fieldname)` returns the stored value, so it
+	is written to the database as is.
+	"""
+
+	def __init__(self, blob_field: str | None = None) -> None:
+		self.blob_field = blob_field
+
+	def __set_name__(self, owner: type, name: str) -> None:
+		self.fieldname = name
+		self.cache_key = f"_{name}_decompressed"
+
+	def __get__(
+		self, doc: "Document | None", owner: type | None = None
+	) -> "str | None | CompressedField":
+		if doc is None:
+			return self
+
+		stored_value = doc.__dict__.get(self.fieldname)
+		reference = doc.__dict__.get(self.blob_field) if self.blob_field else None
+		cached = doc.__dict__.get(self.cache_key)
+
+		if cached and cached[0] is stored_value and cached[1] is reference:
+			value = cached[2]
+			if isinstance(value, bytes):
+				value = value.decode("utf-8")
+				doc.__dict__[self.cache_key] = (stored_value, reference, value)
+
+			return value
+
+		value = load_value(stored_value, reference)
+		doc.__dict__[self.cache_key] = (stored_value, reference, value)
+
+		return value
+
+	def __set__(self, doc: "Document", value: str | bytes | None) -> None:
+		reference = None
+		if self.blob_field:
+			from mail.utils.blob_store import put_blob
+
+			reference = put_blob(value) if value else None
+			doc.__dict__[self.blob_field] = reference
+
+		stored_value = None if reference else compress(value)
+		doc.__dict__[self.fieldname] = stored_value
+		# Bytes are only decoded if the field is read
+		doc.__dict__[self.cache_key] = (stored_value, reference, value)
+
+
+def load_value(stored_value: str | None, reference: str | None = None) -> str | None:
+	"""Returns the value of a field read from the database, from the blob store if it is referenced."""
+
+	if reference:
+		from mail.utils.blob_store import get_blob
+
+		return get_blob(reference)
+
+	return decompress(stored_value)
+
+
+def set_decompressed_onload(doc: "Document") -> None:
+	"""Sends the text of the compressed fields to the form in `__onload.compressed_fields`, e.g. for the UI.
+
+	The fields themselves keep their stored value, so that the document the form posts back matches the
+	database and is saved as is.
+	"""
+
+	compressed_fields = {}
+	for cls in type(doc).__mro__:
+		for name, attr in vars(cls).items():
+			if isinstance(attr, CompressedField):
+				compressed_fields[name] = getattr(doc, name)
+
+	doc.set_onload("compressed_fields", compressed_fields)
@@ -0,0 +1,132 @@
+import re
+import time
+from hashlib import sha256
+from base64 import b64encode
+from functools import lru_cache
+
+WSP_RE = re.compile(r"[ \t]+")
+LINE_BREAK_RE = re.compile(r"\r?\n")
+
+
+class BodyHasher:
+	"""Computes the DKIM body hash incrementally using the `simple` body canonicalization."""
+
+	def __init__(self) -> None:
+		self._hash = sha256()
+		self._pending = b""
+
+	def update(self, data: bytes) -> None:
+		"""Hashes the data, holding back the trailing line breaks until more data is written."""
+
+		if not data:
+			return
+
+		data = self._pending + data
+		content = data.rstrip(b"\r\n")
+		self._hash.update(content)
+		self._pending = data[len(content) :]
+
+	def digest(self) -> bytes:
+		"""Returns the body hash, ignoring the empty lines at the end of the body."""
+
+		hash = self._hash.copy()
+		hash.update(b"\r\n")
+
+		return hash.digest()
+
+
+def parse_headers(headers: str) -> list[tuple[str, str]]:
+	"""Returns the (name, value) pairs of the header block, keeping the folding of the values."""
+
+	parsed_headers = []
+	for line in LINE_BREAK_RE.split(headers):
+		if line[:1] in (" ", "\t") and parsed_headers:
+			name, value = parsed_headers[-1]
+			parsed_headers[-1] = (name, f"{value}\r\n{line}")
+		elif ":" in line:
+			name, value = line.split(":", 1)
+			parsed_headers.append((name, value))
+
+	return parsed_headers
+
+
+def canonicalize_header(name: str, value: str) -> bytes:
+	"""Returns the header using the `relaxed` header canonicalization."""
+
+	value = WSP_RE.sub(" ", LINE_BREAK_RE.sub("", value)).strip()
+	return f"{name.strip().lower()}:{value}".encode("utf-8")
+
+
+def select_headers(
+	headers: list[tuple[str, str]], include_headers: list[str]
+) -> list[tuple[str, str]]:
+	"""Returns the headers to sign, picking the last unused instance of each included header."""
+
+	instances = {}
+	for header in headers:
+		instances.setdefault(header[0].strip().lower(), []).append(header)
+
+	selected_headers = []
+	for name in include_headers:
+		if remaining := instances.get(name.lower()):
+			selected_headers.append(remaining.pop())
+
+	return selected_headers
+
+
+class DKIMSigner:
+	"""Signs messages with the RSA or Ed25519 private key of a domain and selector, parsed only once."""
+
+	def __init__(self, domain: str, selector: str, private_key: str) -> None:
+		from cryptography.hazmat.primitives import serialization
+		from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+
+		self.domain = domain
+		self.selector = selector
+		self._private_key_pem = private_key
+		self.private_key = serialization.load_pem_private_key(private_key.encode(), password=None)
+		self.algorithm = (
+			"ed25519-sha256" if isinstance(self.private_key, Ed25519PrivateKey) else "rsa-sha256"
+		)
+
+	def __reduce__(self) -> tuple:
+		# Sent to another process as the PEM, which is parsed once per process
+		return get_dkim_signer, (self.domain, self.selector, self._private_key_pem)
+
+	def sign(self, headers: str, body_hash: bytes, include_headers: list[str]) -> str:
+		"""Returns the DKIM-Signature header (relaxed/simple) for the header block and body hash."""
+
+		from cryptography.hazmat.primitives import hashes
+		from cryptography.hazmat.primitives.asymmetric import padding
+
+		tags = [
+			f"v=1; a={self.algorithm}; c=relaxed/simple; d={self.domain}; s={self.selector}; t={int(time.time())};",
+			f"h={':'.join(name.lower() for name in include_headers)};",
+			f"bh={b64encode(body_hash).decode()};",
+			"b=",
+		]
+		value = "\r\n\t".join(tags)
+
+		data = b"".join(
+			canonicalize_header(name, header_value) + b"\r\n"
+			for name, header_value in select_headers(parse_headers(headers), include_headers)
+		)
+		data += canonicalize_header("DKIM-Signature", value)
+
+		if self.algorithm == "ed25519-sha256":
+			# Ed25519 signs the SHA-256 hash of the header data (RFC 8463)
+			signature = self.private_key.sign(sha256(data).digest())
+		else:
+			signature = self.private_key.sign(data, padding.PKCS1v15(), hashes.SHA256())
+
+		signature = b64encode(signature).decode()
+		signature = "\r\n\t".join(signature[i : i + 72] for i in range(0, len(signature), 72))
+
+		return f"DKIM-Signature: {value}{signature}"
+
+
+@lru_cache(maxsize=128)
+def get_dkim_signer(domain: str, selector: str, private_key: str) -> DKIMSigner:
+	"""Returns the signer of the domain and selector, parsing the private key only on the first call."""
+
+	return DKIMSigner(domain, selector, private_key)
@@ -0,0 +1,118 @@
+import json
+import frappe
+from frappe import _
+from frappe.utils import cint
+
+IDEMPOTENCY_KEY_HEADER = "Idempotency-Key"
+IN_PROGRESS = "__in_progress__"
+# Short, so that a key is released soon if the worker dies before the request is committed or rolled back
+IN_PROGRESS_EXPIRY = 5 * 60
+
+
+def get_idempotency_key() -> str | None:
+	"""Returns the idempotency key from the request headers."""
+
+	if frappe.request and (key := frappe.request.headers.get(IDEMPOTENCY_KEY_HEADER)):
+		return key.strip() or None
+
+
+def get_cache_key(key: str, user: str | None = None) -> str:
+	"""Returns the cache key of the idempotency key for the given user."""
+
+	return frappe.cache.make_key(f"idempotency|{user or frappe.session.user}|{key}")
+
+
+def get_expiry() -> int:
+	"""Returns the expiry of the idempotency keys in seconds."""
+
+	hours = frappe.db.get_single_value("Mail Settings", "idempotency_key_expiry", cache=True)
+	return max(cint(hours), 1) * 60 * 60
+
+
+def reserve_idempotency_keys(keys: list[str]) -> dict[str, dict | str | None]:
+	"""Reserves the given idempotency keys and returns the stored result of each key.
+
+	A key that was reserved by this call maps to `None`, a key whose request is still being processed
+	maps to `IN_PROGRESS` and a used key maps to `{"name", "status_code"}` of the original response.
+	The keys are released if the transaction is rolled back.
+	"""
+
+	if not keys:
+		return {}
+
+	pipeline = frappe.cache.pipeline()
+
+	for key in keys:
+		pipeline.set(get_cache_key(key), IN_PROGRESS, ex=IN_PROGRESS_EXPIRY, nx=True)
+	for key in keys:
+		pipeline.get(get_cache_key(key))
+
+	results = pipeline.execute()
+	reserved, values = results[: len(keys)], results[len(keys) :]
+
+	if reserved_keys := [key for key, is_reserved in zip(keys, reserved) if is_reserved]:
+		frappe.db.after_rollback.add(lambda: release_idempotency_keys(reserved_keys))
+
+	return {
+		key: None if is_reserved else parse_value(value)
+		for key, is_reserved, value in zip(keys, reserved, values)
+	}
+
+
+def reserve_idempotency_key(key: str) -> dict | None:
+	"""Reserves the idempotency key and returns the stored result, if any."""
+
+	result = reserve_idempotency_keys([key])[key]
+
+	if result == IN_PROGRESS:
+		frappe.throw(
+			_("A request with the {0} {1} is already in progress.").format(
+				IDEMPOTENCY_KEY_HEADER, frappe.bold(key)
+			),
+			exc=frappe.DuplicateEntryError,
+		)
+
+	return result
+
+
+def parse_value(value: bytes | str | None) -> dict | str | None:
+	"""Returns the stored result of an idempotency key, or `IN_PROGRESS`."""
+
+	if isinstance(value, bytes):
+		value = value.decode()
+
+	if not value or value == IN_PROGRESS:
+		return value
+
+	return json.loads(value)
+
+
+def save_idempotency_keys(results: dict[str, str], status_code: int = 200) -> None:
+	"""Stores the Outgoing Mail name and the response status code against each idempotency key
+	once the transaction is committed."""
+
+	if not results:
+		return
+
+	expiry = get_expiry()
+	cache_keys = {
+		get_cache_key(key): json.dumps({"name": name, "status_code": status_code})
+		for key, name in results.items()
+	}
+
+	def _save() -> None:
+		pipeline = frappe.cache.pipeline()
+
+		for cache_key, value in cache_keys.items():
+			pipeline.set(cache_key, value, ex=expiry)
+
+		pipeline.execute()
+
+	frappe.db.after_commit.add(_save)
+
+
+def release_idempotency_keys(keys: list[str]) -> None:
+	"""Releases the reserved idempotency keys so that the requests can be retried."""
+
+	if keys:
+		frappe.cache.delete(*[get_cache_key(key) for key in keys])
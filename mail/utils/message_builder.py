@@ -0,0 +1,70 @@
+import frappe
+from frappe.utils import cint
+from typing import TYPE_CHECKING
+from multiprocessing import get_context
+from mail.utils.dkim_signer import BodyHasher
+from concurrent.futures import ProcessPoolExecutor
+
+if TYPE_CHECKING:
+	from mail.utils.mime import FlattenedMessage
+	from mail.utils.dkim_signer import DKIMSigner
+	from mail.utils.part_cache import EncodedPartCache
+
+_pool: ProcessPoolExecutor | None = None
+_pool_size = 0
+
+
+def build_message(
+	message: "FlattenedMessage",
+	signers: list["DKIMSigner"],
+	include_headers: list[str],
+	cache: "EncodedPartCache | None" = None,
+) -> bytes:
+	"""Returns the serialized message with its attachments encoded and a DKIM-Signature header prepended per signer."""
+
+	# The message is serialized once, its body is hashed for DKIM while it is written
+	body_hasher = BodyHasher()
+	buffer = message.write(cache, on_write=body_hasher.update)
+	body_hash = body_hasher.digest()
+
+	dkim_signatures = "".join(
+		f"{signer.sign(message.headers, body_hash, include_headers)}\r\n" for signer in signers
+	)
+
+	with buffer:
+		return dkim_signatures.encode() + buffer.read()
+
+
+def get_message_builder_pool() -> ProcessPoolExecutor | None:
+	"""Returns the process pool to build messages in, `None` if it is disabled in the Mail Settings.
+
+	The pool is kept for the life of the process, e.g. a web worker. RQ forks a work horse per job, so a job
+	that uses it must shut it down once done, see `process_newsletter_queue`.
+	"""
+
+	global _pool, _pool_size
+
+	pool_size = cint(
+		frappe.db.get_single_value("Mail Settings", "message_builder_processes", cache=True)
+	)
+
+	if pool_size != _pool_size:
+		shutdown_message_builder_pool()
+
+		if pool_size > 0:
+			# Spawned processes do not inherit the database and cache connections of the worker
+			_pool = ProcessPoolExecutor(max_workers=pool_size, mp_context=get_context("spawn"))
+			_pool_size = pool_size
+
+	return _pool
+
+
+def shutdown_message_builder_pool() -> None:
+	"""Shuts down the process pool, a new one is started on the next use."""
+
+	global _pool, _pool_size
+
+	if _pool:
+		_pool.shutdown(wait=False, cancel_futures=True)
+
+	_pool, _pool_size = None, 0
@@ -0,0 +1,189 @@
+import re
+from io import BytesIO, StringIO
+from email import policy
+from secrets import token_hex
+from base64 import encodebytes
+from email.message import Message
+from typing import IO, TYPE_CHECKING, Callable
+from email.generator import Generator
+from email.mime.base import MIMEBase
+from tempfile import SpooledTemporaryFile
+
+if TYPE_CHECKING:
+	from mail.utils.part_cache import EncodedPartCache
+
+# 57 bytes encode to exactly one 76 character base64 line
+BASE64_CHUNK_SIZE = 57 * 1024
+# The buffer is kept in memory up to this size and rolled over to a temporary file after
+SPOOL_MAX_SIZE = 1024 * 1024
+
+
+class MIMEWriter:
+	"""Writes a MIME message into a spooled temporary buffer, encoding the attachments from their files in chunks."""
+
+	def __init__(
+		self,
+		message: Message,
+		linesep: str = "\r\n",
+		cache: "EncodedPartCache | None" = None,
+	) -> None:
+		self.message = message
+		self.linesep = linesep
+		self.cache = cache
+		self.attachments: dict[str, tuple[str | bytes, str | None]] = {}
+
+	def attach(
+		self,
+		source: str | bytes,
+		content_type: str,
+		filename: str,
+		disposition: str = "attachment",
+		content_id: str | None = None,
+		content_hash: str | None = None,
+	) -> None:
+		"""Attaches a base64 encoded part whose content, a file path or bytes, is only read while writing.
+
+		If a `content_hash` is given, the encoded content is reused from and stored in the cache.
+		"""
+
+		maintype, subtype = content_type.split("/", 1)
+		params = {"charset": "utf-8"} if maintype == "text" else {}
+
+		part = MIMEBase(maintype, subtype, policy=policy.SMTP, **params)
+		part["Content-Transfer-Encoding"] = "base64"
+		part.add_header("Content-Disposition", f'{disposition}; filename="{filename}"')
+
+		if content_id:
+			part.add_header("Content-ID", f"<{content_id}>")
+
+		# The placeholder is replaced by the encoded content of the file while writing
+		placeholder = f"__attachment_{token_hex(16)}__"
+		part.set_payload(placeholder)
+		self.message.attach(part)
+		self.attachments[placeholder] = (source, content_hash)
+
+	def flatten(self) -> "FlattenedMessage":
+		"""Returns the serialized message with the attachments still to be encoded."""
+
+		out = StringIO()
+		generator = Generator(
+			out,
+			mangle_from_=False,
+			maxheaderlen=0,
+			policy=self.message.policy.clone(linesep=self.linesep),
+		)
+		generator.flatten(self.message)
+		headers, __, body = out.getvalue().partition(self.linesep * 2)
+		del out
+
+		segments = [body]
+		if self.attachments:
+			segments = [
+				self.attachments.get(segment, segment)
+				for segment in re.split(f"({'|'.join(self.attachments)})", body)
+			]
+
+		return FlattenedMessage(headers, segments, self.linesep)
+
+	def write(self, on_write: Callable[[bytes], None] | None = None) -> SpooledTemporaryFile:
+		"""Returns a buffer with the serialized message, calling `on_write` for every body chunk."""
+
+		return self.flatten().write(self.cache, on_write)
+
+
+class FlattenedMessage:
+	"""A serialized MIME message whose attachments are encoded from their source only while writing.
+
+	It only holds strings, bytes and tuples so that it can be sent to another process.
+	"""
+
+	def __init__(
+		self,
+		headers: str,
+		segments: list[str | tuple[str | bytes, str | None]],
+		linesep: str = "\r\n",
+	) -> None:
+		self.headers = headers
+		self.segments = segments
+		self.linesep = linesep
+
+	def write(
+		self,
+		cache: "EncodedPartCache | None" = None,
+		on_write: Callable[[bytes], None] | None = None,
+	) -> SpooledTemporaryFile:
+		"""Returns a buffer with the serialized message, calling `on_write` for every body chunk."""
+
+		buffer = SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+		buffer.write(f"{self.headers}{self.linesep * 2}".encode("utf-8"))
+
+		def _write(data: bytes) -> None:
+			buffer.write(data)
+			if on_write:
+				on_write(data)
+
+		for segment in self.segments:
+			if isinstance(segment, tuple):
+				self._write_attachment(*segment, cache, _write)
+			elif segment:
+				_write(segment.encode("utf-8"))
+
+		buffer.seek(0)
+		return buffer
+
+	def get_message_without_attachments(self) -> str:
+		"""Returns the message with the content of the attachments left out, e.g. for spam scanning."""
+
+		body = "".join(segment for segment in self.segments if isinstance(segment, str))
+		return f"{self.headers}{self.linesep * 2}{body}"
+
+	def _write_attachment(
+		self,
+		source: str | bytes,
+		content_hash: str | None,
+		cache: "EncodedPartCache | None",
+		write: Callable[[bytes], None],
+	) -> None:
+		"""Writes the base64 encoded content of the attachment, reusing the cached encoding if any."""
+
+		if not cache or not content_hash:
+			with self._open(source) as file:
+				self._write_base64(file, write)
+			return
+
+		key = cache.get_key(content_hash, "base64")
+		if cached := cache.open(key):
+			with cached:
+				while chunk := cached.read(BASE64_CHUNK_SIZE):
+					write(chunk)
+			return
+
+		with self._open(source) as file, cache.store(key) as store:
+
+			def _write(data: bytes) -> None:
+				write(data)
+				store(data)
+
+			self._write_base64(file, _write)
+
+	def _write_base64(self, file: IO[bytes], write: Callable[[bytes], None]) -> None:
+		"""Writes the base64 encoded content of the file in chunks."""
+
+		linesep = self.linesep.encode()
+		first = True
+
+		while chunk := file.read(BASE64_CHUNK_SIZE):
+			if not first:
+				write(linesep)
+
+			write(encodebytes(chunk).rstrip(b"\n").replace(b"\n", linesep))
+			first = False
+
+	@staticmethod
+	def _open(source: str | bytes) -> IO[bytes]:
+		"""Opens the attachment source, a file path or its content, for reading."""
+
+		if isinstance(source, bytes):
+			return BytesIO(source)
+
+		return open(source, "rb")
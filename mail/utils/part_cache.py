@@ -0,0 +1,189 @@
+import os
+import frappe
+from io import BytesIO
+from frappe.utils import cint
+from functools import lru_cache
+from collections import OrderedDict
+from contextlib import contextmanager
+from tempfile import NamedTemporaryFile
+from typing import IO, Callable, Iterator
+
+_encoded_part_caches: dict[str, "EncodedPartCache"] = {}
+
+
+class EncodedPartCache:
+	"""LRU cache of encoded MIME part bodies keyed by file content hash and transfer encoding.
+
+	The parts are kept in memory up to `max_size` bytes and, if `max_disk_size` is set, in `disk_path`
+	up to `max_disk_size` bytes, where the least recently used parts are tracked by modification time.
+	"""
+
+	def __init__(self, max_size: int, disk_path: str | None = None, max_disk_size: int = 0) -> None:
+		self.max_size = max_size
+		# Larger parts are only cached on disk so that one part cannot flush the whole memory cache
+		self.max_part_size = max_size // 4
+		self.max_disk_size = max_disk_size
+		self.disk_path = disk_path if max_disk_size > 0 else None
+		self.size = 0
+		self.hits = 0
+		self.misses = 0
+		self._parts: OrderedDict[str, bytes] = OrderedDict()
+
+		if self.disk_path:
+			os.makedirs(self.disk_path, exist_ok=True)
+
+	def __reduce__(self) -> tuple:
+		# Sent to another process as its settings, each process keeps its own memory cache
+		return get_process_encoded_part_cache, (self.max_size, self.disk_path, self.max_disk_size)
+
+	@staticmethod
+	def get_key(content_hash: str, encoding: str) -> str:
+		"""Returns the cache key of the part."""
+
+		return f"{content_hash}.{encoding}"
+
+	def open(self, key: str) -> IO[bytes] | None:
+		"""Returns the cached part for reading or `None` if it is not cached."""
+
+		if (data := self._parts.get(key)) is not None:
+			self._parts.move_to_end(key)
+			self.hits += 1
+			return BytesIO(data)
+
+		if self.disk_path:
+			path = os.path.join(self.disk_path, key)
+
+			try:
+				file = open(path, "rb")
+			except FileNotFoundError:
+				pass
+			else:
+				os.utime(path)
+				self.hits += 1
+				return file
+
+		self.misses += 1
+
+	@contextmanager
+	def store(self, key: str) -> Iterator[Callable[[bytes], None]]:
+		"""Yields a function to write the encoded part with, the part is cached once it is completely written."""
+
+		chunks, size = [], 0
+		temp_file = None
+
+		if self.disk_path:
+			temp_file = NamedTemporaryFile(prefix=".", dir=self.disk_path, delete=False)
+
+		def write(data: bytes) -> None:
+			nonlocal chunks, size
+
+			size += len(data)
+
+			if chunks is not None:
+				if size <= self.max_part_size:
+					chunks.append(data)
+				else:
+					chunks = None
+
+			if temp_file:
+				temp_file.write(data)
+
+		try:
+			yield write
+		except BaseException:
+			if temp_file:
+				temp_file.close()
+				os.remove(temp_file.name)
+			raise
+
+		if chunks is not None:
+			self._add(key, b"".join(chunks))
+
+		if temp_file:
+			temp_file.close()
+
+			if size <= self.max_disk_size:
+				os.replace(temp_file.name, os.path.join(self.disk_path, key))
+				self._evict_from_disk()
+			else:
+				os.remove(temp_file.name)
+
+	def get_stats(self) -> dict:
+		"""Returns the hits, misses and size of the cache."""
+
+		return {
+			"hits": self.hits,
+			"misses": self.misses,
+			"parts": len(self._parts),
+			"size": self.size,
+		}
+
+	def _add(self, key: str, data: bytes) -> None:
+		"""Adds the part to the memory cache, evicting the least recently used parts."""
+
+		if (existing := self._parts.pop(key, None)) is not None:
+			self.size -= len(existing)
+
+		self._parts[key] = data
+		self.size += len(data)
+
+		while self.size > self.max_size:
+			__, evicted = self._parts.popitem(last=False)
+			self.size -= len(evicted)
+
+	def _evict_from_disk(self) -> None:
+		"""Removes the least recently used parts from the disk cache until it fits in `max_disk_size`."""
+
+		entries = []
+		for entry in os.scandir(self.disk_path):
+			# Skip the parts that are still being written
+			if entry.name.startswith("."):
+				continue
+
+			try:
+				stat = entry.stat()
+			except FileNotFoundError:
+				continue
+
+			entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+		total_size = sum(size for __, size, __ in entries)
+		for __, size, path in sorted(entries):
+			if total_size <= self.max_disk_size:
+				break
+
+			try:
+				os.remove(path)
+			except FileNotFoundError:
+				pass
+
+			total_size -= size
+
+
+def get_encoded_part_cache() -> EncodedPartCache | None:
+	"""Returns the encoded part cache of the site, `None` if it is disabled in the Mail Settings."""
+
+	mail_settings = frappe.get_cached_doc("Mail Settings")
+	max_size = cint(mail_settings.encoded_part_cache_size) * 1024 * 1024
+	max_disk_size = cint(mail_settings.encoded_part_disk_cache_size) * 1024 * 1024
+
+	if not max_size and not max_disk_size:
+		return None
+
+	cache = _encoded_part_caches.get(frappe.local.site)
+	if not cache or (cache.max_size, cache.max_disk_size) != (max_size, max_disk_size):
+		disk_path = os.path.abspath(frappe.get_site_path("private", "encoded_parts"))
+		cache = _encoded_part_caches[frappe.local.site] = EncodedPartCache(
+			max_size, disk_path, max_disk_size
+		)
+
+	return cache
+
+
+@lru_cache(maxsize=8)
+def get_process_encoded_part_cache(
+	max_size: int, disk_path: str | None, max_disk_size: int
+) -> EncodedPartCache:
+	"""Returns the encoded part cache of the process for the given settings."""
+
+	return EncodedPartCache(max_size, disk_path, max_disk_size)
@@ -0,0 +1,111 @@
+import frappe
+from frappe import _
+from frappe.utils import cint
+from typing import Generator
+from contextlib import contextmanager
+
+# Token buckets stored as Redis hashes {tokens, ts}, refilled continuously at `rate` tokens per second
+# up to `capacity`. One token is taken from every bucket only if all of them have a token left,
+# otherwise the number of seconds until they do is returned.
+TOKEN_BUCKET_SCRIPT = """
+local time = redis.call("TIME")
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local tokens = {}
+local wait = 0
+
+for i = 1, #KEYS do
+	local capacity = tonumber(ARGV[i * 2 - 1])
+	local rate = tonumber(ARGV[i * 2])
+	local bucket = redis.call("HMGET", KEYS[i], "tokens", "ts")
+	local available = tonumber(bucket[1]) or capacity
+	local ts = tonumber(bucket[2]) or now
+
+	available = math.min(capacity, available + math.max(0, now - ts) * rate)
+	tokens[i] = available
+
+	if available < 1 then
+		wait = math.max(wait, (1 - available) / rate)
+	end
+end
+
+if wait > 0 then
+	return tostring(wait)
+end
+
+for i = 1, #KEYS do
+	local capacity = tonumber(ARGV[i * 2 - 1])
+	local rate = tonumber(ARGV[i * 2])
+	redis.call("HSET", KEYS[i], "tokens", tostring(tokens[i] - 1), "ts", tostring(now))
+	redis.call("EXPIRE", KEYS[i], math.ceil(capacity / rate) + 1)
+end
+
+return "0"
+"""
+
+
+def get_rate_limits(user: str, mailbox: str, domain_name: str) -> dict[str, int]:
+	"""Returns the rate limits (mails per minute) of the user, mailbox and domain buckets."""
+
+	mail_settings = frappe.get_cached_doc("Mail Settings")
+
+	if not mail_settings.enable_rate_limiting:
+		return {}
+
+	domain_rate_limit = cint(
+		frappe.get_cached_value("Mail Domain", domain_name, "rate_limit")
+	) or cint(mail_settings.rate_limit_per_domain)
+
+	rate_limits = {
+		f"user|{user}": cint(mail_settings.rate_limit_per_user),
+		f"mailbox|{mailbox}": cint(mail_settings.rate_limit_per_mailbox),
+		f"domain|{domain_name}": domain_rate_limit,
+	}
+
+	return {bucket: limit for bucket, limit in rate_limits.items() if limit > 0}
+
+
+def check_rate_limit(user: str, mailbox: str, domain_name: str) -> None:
+	"""Takes a token from the user, mailbox and domain buckets or throws with the seconds to retry after."""
+
+	if not (rate_limits := get_rate_limits(user, mailbox, domain_name)):
+		return
+
+	keys, args = [], []
+	for bucket, limit in rate_limits.items():
+		keys.append(frappe.cache.make_key(f"mail|rate_limit|{bucket}"))
+		args.extend([limit, limit / 60])
+
+	token_bucket = frappe.cache.register_script(TOKEN_BUCKET_SCRIPT)
+	wait = float(token_bucket(keys=keys, args=args))
+
+	if wait > 0:
+		retry_after = max(cint(wait + 0.999), 1)
+		# Set on the response by `retry_after_on_rate_limit` if the request fails with the error
+		frappe.flags.rate_limit_retry_after = retry_after
+
+		frappe.throw(
+			_("Rate limit exceeded for mailbox {0}. Please retry after {1} second(s).").format(
+				frappe.bold(mailbox), frappe.bold(retry_after)
+			),
+			exc=frappe.TooManyRequestsError,
+			title=_("Too Many Requests"),
+		)
+
+
+@contextmanager
+def retry_after_on_rate_limit() -> Generator[None, None, None]:
+	"""Sets the `Retry-After` of the response if the request fails as its rate limit is exceeded.
+
+	The batch endpoints report the error per mail in a successful response, which must not have it.
+	"""
+
+	try:
+		yield
+	except frappe.TooManyRequestsError:
+		if retry_after := frappe.flags.get("rate_limit_retry_after"):
+			frappe.local.response["retry_after"] = retry_after
+
+			if response_headers := getattr(frappe.local, "response_headers", None):
+				response_headers.set("Retry-After", str(retry_after))
+
+		raise
@@ -0,0 +1,91 @@
+import json
+import time
+import frappe
+from typing import Any
+from mail.config.constants import (
+	NOTIFICATION_WINDOW,
+	NOTIFICATION_USERS_KEY,
+	NOTIFICATION_FLUSH_KEY,
+	NOTIFICATION_QUEUE_KEY_PREFIX,
+)
+
+SNIPPET_LENGTH = 200
+
+
+def get_mail_notification(event: str, doctype: str, mail: Any) -> dict:
+	"""Returns the slim payload of the mail event, without the message and the bodies."""
+
+	snippet = " ".join((mail.get("body_plain") or "")[: SNIPPET_LENGTH * 2].split())
+
+	return {
+		"event": event,
+		"doctype": doctype,
+		"name": mail.get("name"),
+		"folder": mail.get("folder"),
+		"subject": mail.get("subject"),
+		"snippet": snippet[:SNIPPET_LENGTH],
+	}
+
+
+def notify_mail_event(event: str, mailbox: str, doctype: str, mail: Any) -> None:
+	"""Notifies the user of the mailbox of the mail event once committed, coalesced with the other events.
+
+	The events of a user are sent as a single `mail_events` message, `{"events": [...]}`, at most
+	`NOTIFICATION_WINDOW` seconds after the first one.
+	"""
+
+	if not mailbox or not (user := frappe.get_cached_value("Mailbox", mailbox, "user")):
+		return
+
+	if not (notifications := frappe.local.flags.get("mail_notifications")):
+		notifications = frappe.local.flags.mail_notifications = {}
+		frappe.db.after_commit.add(queue_mail_notifications)
+		frappe.db.after_rollback.add(lambda: frappe.local.flags.pop("mail_notifications", None))
+
+	notifications.setdefault(user, []).append(get_mail_notification(event, doctype, mail))
+
+
+def queue_mail_notifications() -> None:
+	"""Queues the notifications of the committed transaction and enqueues the flush of the window."""
+
+	if not (notifications := frappe.local.flags.pop("mail_notifications", None)):
+		return
+
+	pipeline = frappe.cache.pipeline()
+	for user, events in notifications.items():
+		key = frappe.cache.make_key(f"{NOTIFICATION_QUEUE_KEY_PREFIX}{user}")
+		pipeline.rpush(key, *[json.dumps(event) for event in events])
+		# Kept for a while in case the flush is lost, e.g. the worker is killed
+		pipeline.expire(key, 60 * 60)
+		pipeline.sadd(frappe.cache.make_key(NOTIFICATION_USERS_KEY), user)
+	pipeline.execute()
+
+	# The first events of a window enqueue its flush, the next ones are sent with them
+	if frappe.cache.set(
+		frappe.cache.make_key(NOTIFICATION_FLUSH_KEY), 1, nx=True, ex=NOTIFICATION_WINDOW * 10
+	):
+		frappe.enqueue(flush_mail_notifications, queue="short")
+
+
+def flush_mail_notifications() -> None:
+	"""Sends the notifications queued during the window, one message per user."""
+
+	time.sleep(NOTIFICATION_WINDOW)
+
+	# Released before the queues are read, so that an event queued meanwhile opens the next window
+	frappe.cache.delete(frappe.cache.make_key(NOTIFICATION_FLUSH_KEY))
+
+	users_key = frappe.cache.make_key(NOTIFICATION_USERS_KEY)
+	while user := frappe.cache.spop(users_key):
+		user = user.decode()
+		key = frappe.cache.make_key(f"{NOTIFICATION_QUEUE_KEY_PREFIX}{user}")
+
+		pipeline = frappe.cache.pipeline()
+		pipeline.lrange(key, 0, -1)
+		pipeline.delete(key)
+		events, __ = pipeline.execute()
+
+		if events:
+			frappe.publish_realtime(
+				"mail_events", {"events": [json.loads(event) for event in events]}, user=user
+			)